@@ -0,0 +1,93 @@
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+_checkpointer: Optional[SqliteSaver] = None
+_step_log: Optional["StepLog"] = None
+_checkpointer_lock = threading.Lock()
+
+
+def _checkpoint_path() -> Optional[str]:
+    path = os.getenv("CHECKPOINT_PATH", ".cache/checkpoints.sqlite")
+    if not path or path.lower() == "off":
+        return None
+    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def get_checkpointer() -> Optional[SqliteSaver]:
+    """Return the process-wide graph checkpointer configured from the environment.
+
+    CHECKPOINT_PATH (default .cache/checkpoints.sqlite; "off" disables checkpointing). The graph
+    state is saved after every node under thread_id = session id, so an interrupted run can be
+    resumed from its last completed node. Several processes may share the file.
+    """
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            path = _checkpoint_path()
+            if path is None:
+                return None
+            # SqliteSaver serializes its own access to the connection and switches it to WAL
+            _checkpointer = SqliteSaver(sqlite3.connect(path, check_same_thread=False, timeout=30))
+        return _checkpointer
+
+
+class StepLog:
+    """Coder steps finished so far, keyed by (thread id, task plan id, step index).
+
+    The coder node runs the whole plan, so its checkpoint is only written once every step is
+    done. Each step is recorded here as soon as it finishes, so a resumed run skips the steps
+    the interrupted one already wrote. Lives in the checkpoint database.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS coder_steps ("
+                " thread_id TEXT NOT NULL, task_plan_id TEXT NOT NULL, step_index INTEGER NOT NULL,"
+                " result TEXT NOT NULL, PRIMARY KEY (thread_id, task_plan_id, step_index))"
+            )
+            self.conn.commit()
+
+    def record(self, thread_id: str, task_plan_id: str, step_index: int, result: dict):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO coder_steps (thread_id, task_plan_id, step_index, result)"
+                " VALUES (?, ?, ?, ?)",
+                (thread_id, task_plan_id, step_index, json.dumps(result)),
+            )
+            self.conn.commit()
+
+    def finished(self, thread_id: str, task_plan_id: str) -> Dict[int, dict]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT step_index, result FROM coder_steps WHERE thread_id = ? AND task_plan_id = ?",
+                (thread_id, task_plan_id),
+            ).fetchall()
+        return {index: json.loads(result) for index, result in rows}
+
+    def forget(self, thread_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM coder_steps WHERE thread_id = ?", (thread_id,))
+            self.conn.commit()
+
+
+def get_step_log() -> Optional[StepLog]:
+    """Return the process-wide coder step log; None when checkpointing is off."""
+    global _step_log
+    with _checkpointer_lock:
+        if _step_log is None:
+            path = _checkpoint_path()
+            if path is None:
+                return None
+            _step_log = StepLog(path)
+        return _step_log
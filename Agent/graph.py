@@ -1,3 +1,10 @@
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,36 +15,78 @@ from langgraph.prebuilt import create_react_agent
 from .prompts import *
 from .states import *
 from .tools import *
-from .tools import set_event_emitter, init_project_root, emit_event
+from .tools import set_event_emitter, init_project_root, emit_event, track_writes, StepWrites
+from .scheduler import CODER_MAX_WORKERS, STEP_FUSION, fuse_steps, run_plan
+from .llm_cache import get_llm_cache
+from .plan_cache import get_plan_cache
+from .checkpoints import get_checkpointer, get_step_log
 
 from langgraph.constants import END
 from langgraph.graph import StateGraph
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.outputs import Generation
+from langchain_core.runnables import RunnableConfig
 
-llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
+# temperature=0 makes responses reproducible, so identical calls are served from the response cache
+llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0, cache=get_llm_cache())
 
 # For generations that must NEVER call tools:
 LLM_NO_TOOLS = llm.bind(tools=[], tool_choice="none")
+# Structured (planner/architect) calls skip the response cache; run_structured caches only answers that parse
+LLM_STRUCTURED = llm.model_copy(update={"cache": False}).bind(tools=[], tool_choice="none")
 
-CODER = llm.bind_tools(
-    [read_file, write_file, list_files, get_current_directory],
-    tool_choice="auto",
-)
+CODER_TOOLS = [read_file, write_file, edit_file, apply_patch, list_files, get_current_directory]
 set_debug(True)
 set_verbose(True)
 
+# Reuse plans for near-duplicate prompts ("Create a to-do app" vs "build a simple todo list web app")
+PLAN_CACHE = get_plan_cache()
+# Also reuse the architect's task plan on a plan cache hit
+PLAN_CACHE_TASK_PLANS = os.getenv("PLAN_CACHE_TASK_PLANS", "0") == "1"
+
+
+def _plan_cache_call(method: str, *args):
+    """Call a plan cache method; the cache is an optimization, so its failures never fail planning."""
+    if not PLAN_CACHE:
+        return None
+    try:
+        return getattr(PLAN_CACHE, method)(*args)
+    except Exception as e:
+        print(f"Plan cache {method} failed: {e}")
+        return None
+
 
 def run_structured(schema_cls, prompt: str):
+    """Ask for JSON matching `schema_cls` and parse it.
+
+    Only answers that parse are cached, so a one-off malformed answer is not replayed on retries.
+    """
     parser = PydanticOutputParser(pydantic_object=schema_cls)
     fmt = parser.get_format_instructions()
     sys = "Return ONLY JSON matching the schema. No prose."
-    raw = LLM_NO_TOOLS.invoke([
+    messages = [
         SystemMessage(content=sys),
         HumanMessage(content=f"{prompt}\n\n{fmt}")
-    ])
+    ]
+    cache = get_llm_cache()
+    # Keyed on the messages, schema and model; kept apart from the model's own cache entries
+    model = f"{getattr(llm, 'model_name', '')}:{getattr(llm, 'temperature', '')}"
+    cache_args = (json.dumps([message.content for message in messages]), f"structured:{schema_cls.__name__}:{model}")
+    if cache is not None:
+        cached = cache.lookup(*cache_args)
+        if cached:
+            try:
+                return parser.parse(cached[0].text)
+            except Exception as e:
+                print(f"Cached {schema_cls.__name__} answer no longer parses, asking again: {e}")
+
+    raw = LLM_STRUCTURED.invoke(messages)
     text = raw.content if hasattr(raw, "content") else str(raw)
-    return parser.parse(text)
+    result = parser.parse(text)
+    if cache is not None:
+        cache.update(*cache_args, [Generation(text=text)])
+    return result
 
 
 def planner_agent(state: dict) -> dict:
@@ -48,8 +97,20 @@ def planner_agent(state: dict) -> dict:
     emit_event("node", {"value": "planner", "action": "start"})
 
     try:
-        plan_obj = run_structured(Plan, planner_prompt(user_prompt))
-        result = {"plan": plan_obj.model_dump()}
+        hit = _plan_cache_call("lookup", user_prompt)
+        if hit:
+            plan_obj = Plan(**hit.plan)
+            result = {"plan": plan_obj.model_dump(), "plan_cache_id": hit.entry_id}
+            if PLAN_CACHE_TASK_PLANS and hit.task_plan:
+                result["cached_task_plan"] = hit.task_plan
+            print(f"Planner reused cached plan {plan_obj.name} (similarity {hit.similarity:.2f} to '{hit.prompt}')")
+            emit_event("cache", {"value": "plan", "similarity": round(hit.similarity, 3), "prompt": hit.prompt})
+        else:
+            plan_obj = run_structured(Plan, planner_prompt(user_prompt))
+            result = {"plan": plan_obj.model_dump()}
+            plan_cache_id = _plan_cache_call("add", user_prompt, result["plan"])
+            if plan_cache_id is not None:
+                result["plan_cache_id"] = plan_cache_id
         print(f"Planner created plan: {plan_obj.name} with {len(plan_obj.files)} files")
         
         # Emit node end event
@@ -81,7 +142,18 @@ def architect_agent(state: dict) -> dict:
     print(f"Architect processing plan: {plan.name}")
 
     try:
-        task_plan_obj = run_structured(TaskPlan, architect_prompt(plan))
+        if state.get("cached_task_plan"):
+            task_plan_obj = TaskPlan(**state["cached_task_plan"])
+            print("Architect reused cached task_plan")
+        else:
+            task_plan_obj = run_structured(TaskPlan, architect_prompt(plan))
+            if state.get("plan_cache_id"):
+                _plan_cache_call("attach_task_plan", state["plan_cache_id"], task_plan_obj.model_dump())
+        if STEP_FUSION:
+            # One coder call per file where possible, instead of one per architect step
+            planned = len(task_plan_obj.implementation_steps)
+            task_plan_obj.implementation_steps = fuse_steps(task_plan_obj.implementation_steps)
+            print(f"Fused {planned} architect steps into {len(task_plan_obj.implementation_steps)}")
         out = task_plan_obj.model_dump()
         out["plan"] = plan.model_dump() if hasattr(plan, "model_dump") else plan
         print(f"Architect created task_plan with {len(task_plan_obj.implementation_steps)} steps")
@@ -89,7 +161,7 @@ def architect_agent(state: dict) -> dict:
         # Emit node end event
         emit_event("node", {"value": "architect", "action": "end", "success": True, "steps": len(task_plan_obj.implementation_steps)})
         
-        return {"task_plan": out}
+        return {"task_plan": out, "task_plan_id": uuid.uuid4().hex}
     except Exception as e:
         print(f"Architect error: {e}")
         
@@ -97,116 +169,88 @@ def architect_agent(state: dict) -> dict:
         emit_event("node", {"value": "architect", "action": "end", "success": False, "error": str(e)})
         
         return {"task_plan": {"implementation_steps": [],
-                              "plan": plan.model_dump() if hasattr(plan, "model_dump") else plan}}
-
-
-def coder_agent(state: dict) -> dict:
-    """LangGraph tool-using coder agent that processes one step at a time."""
-    print(f"\n=== CODER AGENT ENTRY ===")
-    print(f"Coder agent received state keys: {list(state.keys())}")
-
-    # Debug: Print the full state
-    if "coder_state" in state:
-        print(f"Existing coder_state: {state['coder_state']}")
-
-    # Check if task_plan exists in state, state checking logic to handle the case where the task_plan is in the coder_state
-    task_plan_data = None
-    if "task_plan" in state:
-        task_plan_data = state["task_plan"]
-    elif"coder_state" in state and "task_plan" in state["coder_state"]:
-        task_plan_data = state["coder_state"]["task_plan"]
-    else:
-        print("ERROR: No task_plan found in state")
-        emit_event("error", {"message": "No task_plan found in state"})
-        return {"coder_state": {"current_step_idx": 999, "task_plan": {"implementation_steps": []}}}
-
-    # coder_state reconstruction properly
-    coder_state_data = state.get("coder_state")
-    if coder_state_data is None:
-        print("No existing coder_state, creating new one")
-        task_plan = TaskPlan(**task_plan_data) if isinstance(task_plan_data, dict) else task_plan_data
-        coder_state = CoderState(task_plan=task_plan, current_step_idx=0)
-        print(f"Initialized new coder_state with {len(task_plan.implementation_steps)} steps")
-        
-        # Emit coder start event
-        emit_event("node", {"value": "coder", "action": "start", "total_steps": len(task_plan.implementation_steps)})
-    else:
-        print(f"Reconstructing coder_state from: {coder_state_data}")
-        # The issue was here - we need to properly reconstruct the nested TaskPlan
-        if isinstance(coder_state_data, dict):
-            # Extract task_plan data and reconstruct it properly
-            task_plan_data = coder_state_data.get("task_plan", {})
-            if isinstance(task_plan_data, dict):
-                task_plan = TaskPlan(**task_plan_data)
-            else:
-                task_plan = task_plan_data
-
-            coder_state = CoderState(
-                task_plan=task_plan,
-                current_step_idx=coder_state_data.get("current_step_idx", 0),
-                current_file_content=coder_state_data.get("current_file_content")
-            )
-        else:
-            coder_state = coder_state_data
-
-    print(f"Current coder_state: step {coder_state.current_step_idx}")
-
-    steps = coder_state.task_plan.implementation_steps
-    print(f"Total implementation steps: {len(steps)}")
+                              "plan": plan.model_dump() if hasattr(plan, "model_dump") else plan},
+                "task_plan_id": uuid.uuid4().hex}
+
+
+# Compiled ReAct coders by (model, tool names); compiling one per step was a measurable share of CPU
+_coder_agents: Dict[Tuple[int, Tuple[str, ...]], Tuple[Any, Any]] = {}
+_coder_agents_lock = threading.Lock()
+
+
+def get_coder_agent(model=None, tools=None):
+    """The compiled ReAct coder for (model, tools), built once and shared by every step and session.
+
+    Tools find their session through the caller's context (see tools.set_event_emitter), so one
+    compiled agent serves all sessions.
+    """
+    model = model if model is not None else llm
+    tools = tools if tools is not None else CODER_TOOLS
+    key = (id(model), tuple(tool.name for tool in tools))
+    with _coder_agents_lock:
+        cached = _coder_agents.get(key)
+        # The cached entry holds the model, so its id cannot be reused while it is here
+        if cached is None or cached[0] is not model:
+            cached = _coder_agents[key] = (model, create_react_agent(model, tools))
+        return cached[1]
+
+
+def strip_code_fence(content: str) -> str:
+    """Remove a surrounding markdown code fence from a generated file."""
+    content = content.strip()
+    if content.startswith('```'):
+        lines = content.split('\n')
+        if lines[0].startswith('```'):
+            lines = lines[1:]
+        if lines and lines[-1].strip() == '```':
+            lines = lines[:-1]
+        content = '\n'.join(lines)
+    return content
+
+
+def generate_file(filepath: str, task_prompt: str) -> bool:
+    """Generate a file's complete content in one LLM call and write it; False if none came back."""
+    generate_sys = (
+        "You are the CODER. Generate the complete file content for the implementation. "
+        "Provide only the code, no explanations or markdown formatting."
+    )
+    response = LLM_NO_TOOLS.invoke([
+        SystemMessage(content=generate_sys),
+        HumanMessage(content=task_prompt)
+    ])
+    content = strip_code_fence(response.content or "")
+    if not content:
+        return False
 
-    # Check if we're done with all steps
-    if coder_state.current_step_idx >= len(steps):
-        print("All implementation steps completed!")
-        emit_event("node", {"value": "coder", "action": "end", "success": True, "completed_steps": len(steps)})
-        emit_event("done", {"message": "All steps completed successfully"})
-        return {"coder_state": coder_state.model_dump()}
+    print(f"Writing generated content to {filepath} ({len(content)} chars)")
+    # Tools take their arguments as one dict; write_file(path, content) does not work
+    write_result = write_file.invoke({"path": filepath, "content": content})
+    print(f"Write result: {write_result}")
+    return True
 
-    # Get current task
-    current_task = steps[coder_state.current_step_idx]
-    print(f"Processing step {coder_state.current_step_idx + 1}/{len(steps)}: {current_task.task_description}")
-    print(f"Target file: {current_task.filepath}")
-    
-    # Emit step start event
-    emit_event("step", {
-        "step_index": coder_state.current_step_idx,
-        "total_steps": len(steps),
-        "filepath": current_task.filepath,
-        "description": current_task.task_description
-    })
 
-    # TEST: Try writing a simple test file to verify write_file works
-    try:
-        test_result = write_file("test.txt", "Hello World Test")
-        print(f"Test write result: {test_result}")
-        test_verify = read_file("test.txt")
-        print(f"Test file verification: {len(test_verify)} chars")
-    except Exception as test_e:
-        print(f"Test file write failed: {test_e}")
-
-    # Read existing file content
-    try:
-        existing_content = read_file(current_task.filepath)
-        print(f"Found existing content in {current_task.filepath}: {len(existing_content)} characters")
-    except Exception as e:
-        print(f"No existing file {current_task.filepath}: {e}")
-        existing_content = ""
+def implement_with_tools(step_idx: int, current_task: ImplementationTask, task_prompt: str,
+                         writes: StepWrites, editing: bool = False) -> bool:
+    """Run the tool-using ReAct coder on a step, generating the file directly if it writes nothing.
 
-    # Prepare prompts
+    With `editing` (the file already has content) the coder is steered to patch it rather than
+    rewrite it.
+    """
     system_prompt = coder_system_prompt()
-    user_prompt = (
-        f"Task: {current_task.task_description}\n"
-        f"File: {current_task.filepath}\n"
-        f"Existing content:\n{existing_content}\n"
-        "Use write_file(path, content) to save your changes."
-    )
+    if editing:
+        # Edits cost output tokens for the changed lines only, instead of the whole file
+        user_prompt = task_prompt + (
+            "Use edit_file(path, search, replace) or apply_patch(path, patch) to change the existing "
+            "content; use write_file(path, content) only to create a file."
+        )
+    else:
+        user_prompt = task_prompt + "Use write_file(path, content) to save your changes."
 
     success = False
     try:
-        # Create and invoke react agent
-        coder_tools = [read_file, write_file, list_files, get_current_directory]
-        react_agent = create_react_agent(llm, coder_tools)
+        react_agent = get_coder_agent()
 
-        print(f"Invoking React agent with tools: {[tool.name for tool in coder_tools]}")
+        print(f"Invoking React agent with tools: {[tool.name for tool in CODER_TOOLS]}")
         result = react_agent.invoke({
             "messages": [
                 {"role": "system", "content": system_prompt},
@@ -214,21 +258,12 @@ def coder_agent(state: dict) -> dict:
             ]
         })
 
-        print(f"React agent result type: {type(result)}")
-        print(f"React agent result keys: {list(result.keys()) if isinstance(result, dict) else 'Not a dict'}")
-
-        # Check if any files were actually written by listing the directory
-        try:
-            files_after = list_files(".")
-            print(f"Files after React agent: {files_after}")
-        except:
-            print("Could not list files after React agent")
-
+        print(f"React agent made {len(result['messages'])} messages and wrote {[entry.path for entry in writes.writes]}")
         print(f"React agent completed task for {current_task.filepath}")
         success = True
 
     except Exception as e:
-        print(f"React agent failed for step {coder_state.current_step_idx}: {e}")
+        print(f"React agent failed for step {step_idx}: {e}")
         print(f"Exception type: {type(e)}")
         import traceback
         print(f"Traceback: {traceback.format_exc()}")
@@ -236,53 +271,14 @@ def coder_agent(state: dict) -> dict:
 
     # If react agent failed OR if no file was actually written, try fallback
     try:
-        # Check if the file exists after the react agent
-        file_exists_after_react = False
-        try:
-            test_content = read_file(current_task.filepath)
-            file_exists_after_react = len(test_content.strip()) > 0
-            print(f"File {current_task.filepath} exists after React: {file_exists_after_react}")
-        except:
-            file_exists_after_react = False
-            print(f"File {current_task.filepath} does not exist after React agent")
+        # write_file recorded what the step wrote, so this needs no re-read
+        written = writes.last_write(current_task.filepath)
+        file_exists_after_react = written is not None and written.size > 0
+        print(f"File {current_task.filepath} written by React: {file_exists_after_react}")
 
         if not success or not file_exists_after_react:
             print("React agent didn't create the file, trying fallback...")
-            fallback_sys = (
-                "You are the CODER. Generate the complete file content for the implementation. "
-                "Provide only the code, no explanations or markdown formatting."
-            )
-            fallback_resp = LLM_NO_TOOLS.invoke([
-                SystemMessage(content=fallback_sys),
-                HumanMessage(content=user_prompt)
-            ])
-
-            print(f"Fallback response length: {len(fallback_resp.content) if fallback_resp.content else 0}")
-            print(
-                f"Fallback response preview: {fallback_resp.content[:200] if fallback_resp.content else 'No content'}")
-
-            if fallback_resp.content:
-                # Clean up the response content (remove markdown if present)
-                content = fallback_resp.content.strip()
-                if content.startswith('```'):
-                    lines = content.split('\n')
-                    if lines[0].startswith('```'):
-                        lines = lines[1:]
-                    if lines and lines[-1].strip() == '```':
-                        lines = lines[:-1]
-                    content = '\n'.join(lines)
-
-                print(f"Writing fallback content to {current_task.filepath} ({len(content)} chars)")
-                write_result = write_file(current_task.filepath, content)
-                print(f"Fallback write result: {write_result}")
-
-                # Verify the file was actually written
-                try:
-                    verify_content = read_file(current_task.filepath)
-                    print(f"Verification: File {current_task.filepath} now contains {len(verify_content)} characters")
-                except Exception as verify_e:
-                    print(f"Could not verify file was written: {verify_e}")
-            else:
+            if not generate_file(current_task.filepath, task_prompt):
                 print("No content generated in fallback")
 
     except Exception as fallback_e:
@@ -290,56 +286,176 @@ def coder_agent(state: dict) -> dict:
         import traceback
         print(f"Fallback traceback: {traceback.format_exc()}")
 
-    # Increment step index
-    coder_state.current_step_idx += 1
-    print(f"Incremented step index to: {coder_state.current_step_idx}")
-    print(f"Total steps: {len(steps)}")
-    
+    return success
+
+
+def implement_step(step_idx: int, current_task: ImplementationTask, total_steps: int) -> StepResult:
+    """Run the coder on a single implementation step; new self-contained files skip the tool loop."""
+    print(f"Processing step {step_idx + 1}/{total_steps}: {current_task.task_description}")
+    print(f"Target file: {current_task.filepath}")
+
+    # Emit step start event
+    emit_event("step", {
+        "step_index": step_idx,
+        "total_steps": total_steps,
+        "filepath": current_task.filepath,
+        "description": current_task.task_description
+    })
+
+    # Read existing file content (the only read of the target this step makes)
+    try:
+        existing_content = read_file.invoke({"path": current_task.filepath})
+        print(f"Found existing content in {current_task.filepath}: {len(existing_content)} characters")
+    except Exception as e:
+        print(f"No existing file {current_task.filepath}: {e}")
+        existing_content = ""
+
+    # Prepare prompts
+    task_prompt = (
+        f"Task: {current_task.task_description}\n"
+        f"File: {current_task.filepath}\n"
+        f"Existing content:\n{existing_content}\n"
+    )
+
+    success = False
+    with track_writes() as writes:
+        if not existing_content.strip() and not current_task.depends_on:
+            # Fast path: a brand-new file that reads no other file is generated in one call and
+            # written directly; the tool loop is kept for edits and files that build on others
+            print(f"New self-contained file {current_task.filepath}, generating it directly")
+            try:
+                success = generate_file(current_task.filepath, task_prompt)
+            except Exception as e:
+                print(f"Direct generation failed for step {step_idx}: {e}")
+
+        if not success:
+            success = implement_with_tools(step_idx, current_task, task_prompt, writes,
+                                           editing=bool(existing_content.strip()))
+
     # Emit step completion event
     emit_event("step_complete", {
-        "step_index": coder_state.current_step_idx - 1,
-        "total_steps": len(steps),
+        "step_index": step_idx,
+        "total_steps": total_steps,
         "filepath": current_task.filepath,
-        "success": True
+        "success": success
     })
+    return {
+        "step_index": step_idx,
+        "filepath": current_task.filepath,
+        "success": success,
+        "writes": [{"path": entry.path, "size": entry.size, "sha256": entry.sha256} for entry in writes.writes],
+    }
+
+
+# Parsed steps per task plan id, so the coder and should_continue do not re-validate the whole plan
+_parsed_steps: "OrderedDict[str, List[ImplementationTask]]" = OrderedDict()
+_parsed_steps_lock = threading.Lock()
+_PARSED_STEPS_MAX = 64
+
+
+def plan_steps(state: GraphState) -> List[ImplementationTask]:
+    """The run's implementation steps, parsed once per task plan."""
+    plan_id = state.get("task_plan_id")
+    with _parsed_steps_lock:
+        steps = _parsed_steps.get(plan_id) if plan_id else None
+        if steps is not None:
+            _parsed_steps.move_to_end(plan_id)
+            return steps
+    steps = TaskPlan(**state["task_plan"]).implementation_steps
+    if plan_id:
+        with _parsed_steps_lock:
+            _parsed_steps[plan_id] = steps
+            while len(_parsed_steps) > _PARSED_STEPS_MAX:
+                _parsed_steps.popitem(last=False)
+    return steps
+
+
+def emit_coder_end(results: List[StepResult], total_steps: int):
+    """Report the end of the coder with the outcome of every step of the plan."""
+    failed = sorted(result["step_index"] for result in results if not result["success"])
+    emit_event("node", {"value": "coder", "action": "end", "success": not failed, "completed_steps": total_steps,
+                        "failed_steps": failed})
+    if failed:
+        message = f"{len(failed)} of {total_steps} steps failed"
+    else:
+        message = "All steps completed successfully"
+    emit_event("done", {"message": message, "success": not failed})
 
-    # Return the updated coder_state
-    result = {"coder_state": coder_state.model_dump()}
-    print(f"Returning coder state: current_step_idx = {coder_state.current_step_idx}")
-    return result
 
+def coder_agent(state: GraphState, config: RunnableConfig = None) -> dict:
+    """LangGraph tool-using coder agent that runs the remaining steps of the plan in parallel.
 
-def should_continue(state: dict):
-    """Determine if we should continue coding or end by checking step progress."""
-    coder_state = state.get("coder_state")
+    Each step starts as soon as the steps it depends on are done (see scheduler.run_plan).
+    Returns only the steps this run finished; the graph's reducers append them to the state.
+    For checkpointed session runs every finished step is also written to the step log, so a
+    resumed run skips the steps an interrupted one already did.
+    """
+    print(f"\n=== CODER AGENT ENTRY ===")
 
-    print(f"\n=== CONDITIONAL CHECK ===")
-    print(f"State keys: {list(state.keys())}")
+    if "task_plan" not in state:
+        print("ERROR: No task_plan found in state")
+        emit_event("error", {"message": "No task_plan found in state"})
+        return {}
+
+    steps = plan_steps(state)
+    completed = list(state.get("completed_steps") or [])
+
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    plan_id = state.get("task_plan_id")
+    step_log = get_step_log() if thread_id and plan_id and CHECKPOINTER is not None else None
+    recovered = {}
+    if step_log is not None:
+        recovered = {idx: result for idx, result in step_log.finished(thread_id, plan_id).items()
+                     if idx not in completed and idx < len(steps)}
+        if recovered:
+            print(f"Coder: skipping {len(recovered)} steps finished before the interruption")
+            completed += list(recovered)
+    print(f"Coder: {len(completed)}/{len(steps)} steps completed")
+
+    if not completed:
+        # Emit coder start event
+        emit_event("node", {"value": "coder", "action": "start", "total_steps": len(steps)})
 
-    if coder_state and isinstance(coder_state, dict):
-        current_idx = coder_state.get("current_step_idx", 0)
-        task_plan = coder_state.get("task_plan", {})
-        implementation_steps = task_plan.get("implementation_steps", [])
-        total_steps = len(implementation_steps)
+    # Check if we're done with all steps
+    if len(completed) >= len(steps):
+        print("All implementation steps completed!")
+        emit_coder_end(list(state.get("step_results") or []) + list(recovered.values()), len(steps))
+        finished = sorted(recovered)
+        return {"completed_steps": finished, "step_results": [recovered[idx] for idx in finished]}
+
+    def record(idx: int, result: StepResult):
+        if step_log is not None:
+            step_log.record(thread_id, plan_id, idx, result)
+
+    # Steps on the same file depend on each other, so they never run together
+    print(f"Running {len(steps) - len(completed)} steps with up to {CODER_MAX_WORKERS} workers")
+    results = run_plan(steps, completed, lambda idx: implement_step(idx, steps[idx], len(steps)),
+                       CODER_MAX_WORKERS, on_done=record)
+    print(f"Completed {len(completed) + len(results)}/{len(steps)} steps")
+    results.update(recovered)
+    emit_coder_end(list(state.get("step_results") or []) + list(results.values()), len(steps))
+    finished = sorted(results)
+    return {"completed_steps": finished, "step_results": [results[idx] for idx in finished]}
+
+
+def should_continue(state: GraphState):
+    """Determine if we should continue coding or end by checking step progress."""
+    if "task_plan" not in state:
+        print("-> No task_plan found, going to END")
+        return "END"
 
-        print(f"Current step index: {current_idx}")
-        print(f"Total steps: {total_steps}")
-        print(f"Steps completed: {current_idx}/{total_steps}")
+    total_steps = len(plan_steps(state))
+    completed = len(state.get("completed_steps") or [])
+    print(f"\n=== CONDITIONAL CHECK === Steps completed: {completed}/{total_steps}")
 
-        if current_idx >= total_steps:
-            print("-> All steps completed, going to END")
-            return "END"
-        else:
-            print(f"-> Still have steps remaining, continuing to coder")
-            return "coder"
-    else:
-        print(f"-> No valid coder_state found, going to END")
-        print(f"coder_state type: {type(coder_state)}")
-        print(f"coder_state value: {coder_state}")
+    if completed >= total_steps:
+        print("-> All steps completed, going to END")
         return "END"
+    print(f"-> Still have steps remaining, continuing to coder")
+    return "coder"
 
 
-graph = StateGraph(dict)
+graph = StateGraph(GraphState)
 graph.add_node("planner", planner_agent)
 graph.add_node("architect", architect_agent)
 graph.add_node("coder", coder_agent)
@@ -355,18 +471,47 @@ graph.set_entry_point("planner")
 
 agent = graph.compile()
 
+# Session runs are checkpointed after every node (thread_id = session id), so a run that was
+# interrupted by a crash or restart can be resumed instead of starting over
+CHECKPOINTER = get_checkpointer()
+session_agent = graph.compile(checkpointer=CHECKPOINTER) if CHECKPOINTER is not None else agent
+
+
+def session_config(session_id: str, recursion_limit: int = 100) -> dict:
+    """Invocation config for a session's run; pass it again with input None to resume."""
+    return {"recursion_limit": recursion_limit, "configurable": {"thread_id": session_id}}
+
+
+def can_resume(session_id: str) -> bool:
+    """Whether the session has a checkpointed run that stopped before reaching END."""
+    if CHECKPOINTER is None:
+        return False
+    return bool(session_agent.get_state(session_config(session_id)).next)
+
+
+def forget_session(session_id: str):
+    """Drop a session's checkpoints and step log once its run has finished."""
+    if CHECKPOINTER is not None:
+        CHECKPOINTER.delete_thread(session_id)
+        get_step_log().forget(session_id)
+
 def create_session_agent(session_id: str, event_emitter=None):
-    """Create an agent instance for a specific session with event emission."""
+    """Create an agent instance for a specific session with event emission.
+
+    The session is bound to the current context (see tools.set_event_emitter), so call this
+    from the thread or task that will invoke the agent. Other sessions running concurrently
+    in the same process keep their own context.
+    """
     # Set up event emitter and session context
-    if event_emitter:
-        set_event_emitter(event_emitter, session_id)
+    set_event_emitter(event_emitter, session_id)
     
     # Initialize project root for this session
     project_path = init_project_root(session_id)
     print(f"Project root initialized for session {session_id} at: {project_path}")
     
-    # Return the compiled agent (same graph, but tools will use session context)
-    return agent
+    # Return the checkpointed agent (same graph, but tools will use session context);
+    # invoke it with session_config(session_id)
+    return session_agent
 
 if __name__ == "__main__":
     # Test the session-aware agent
@@ -378,10 +523,10 @@ if __name__ == "__main__":
         print(f"[{session_id}] Event: {event}")
     
     # Create session agent
-    session_agent = create_session_agent(session_id, test_emitter)
+    test_agent = create_session_agent(session_id, test_emitter)
     
     user_prompt = "Create a simple To-do list Web Application"
-    result = session_agent.invoke({"user_prompt": user_prompt},
-                                  {"recursion_limit": 100})
+    result = test_agent.invoke({"user_prompt": user_prompt},
+                               session_config(session_id))
     print("Final result:")
     print(result)
\ No newline at end of file
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+
+# All a cached response can hold; anything else in the file is refused when decoding
+_CACHED_CLASSES = [Generation, ChatGeneration, AIMessage]
+
+# Per-call message fields that do not change what the model is asked (random ids, timings, token counts)
+_VOLATILE_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+def _strip_volatile(node):
+    if isinstance(node, list):
+        return [_strip_volatile(item) for item in node]
+    if isinstance(node, dict):
+        if node.get("lc") == 1 and isinstance(node.get("kwargs"), dict):
+            kwargs = {k: v for k, v in node["kwargs"].items() if k not in _VOLATILE_MESSAGE_FIELDS}
+            return {**node, "kwargs": _strip_volatile(kwargs)}
+        return {k: _strip_volatile(v) for k, v in node.items()}
+    return node
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Content address of an LLM call: hash of the model config (id, params, tools) and the messages."""
+    try:
+        prompt = json.dumps(_strip_volatile(json.loads(prompt)), sort_keys=True)
+    except ValueError:
+        pass
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class SQLiteResponseCache(BaseCache):
+    """On-disk LLM response cache with LRU eviction, TTL, size caps and hit/miss counters.
+
+    Plugs into LangChain's cache interface, so every call made through a chat model built with
+    `cache=` (plain invokes, tool-bound calls and the ReAct coder loop) is looked up first.
+    Only use it for deterministic (temperature 0) models.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000, max_bytes: int = 256 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        try:
+            return loads(row[0], allowed_objects=_CACHED_CLASSES)
+        except Exception as e:
+            print(f"LLM cache entry {key[:12]} could not be decoded: {e}")
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = cache_key(prompt, llm_string)
+        value = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until under both caps. Caller holds the lock."""
+        if self.ttl_seconds is not None:
+            cur = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self.evictions += cur.rowcount
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            batch = max(1, count - self.max_entries, count // 20)
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k, _ in rows])
+            self.evictions += len(rows)
+            count -= len(rows)
+            total -= sum(size for _, size in rows)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size of the cache."""
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "path": str(self.path),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": count,
+            "bytes": total,
+        }
+
+
+_llm_cache: Optional[BaseCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[BaseCache]:
+    """Return the process-wide LLM response cache configured from the environment.
+
+    LLM_CACHE_PATH (default .cache/llm_responses.sqlite; empty or "off" disables it),
+    LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_MB and LLM_CACHE_TTL_HOURS (0 keeps entries forever).
+    """
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            path = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite")
+            if not path or path.lower() == "off":
+                return None
+            ttl_hours = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+            _llm_cache = SQLiteResponseCache(
+                path,
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000")),
+                max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+                ttl_seconds=ttl_hours * 3600 if ttl_hours > 0 else None,
+            )
+        return _llm_cache
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import pathlib
+import posixpath
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    path: str
+    size: int
+    mtime: float
+    sha256: str
+
+
+def _entry_token(entry: ManifestEntry) -> int:
+    return int.from_bytes(hashlib.sha256(f"{entry.path}\0{entry.sha256}".encode("utf-8")).digest()[:8], "big")
+
+
+class ProjectManifest:
+    """In-memory index of a project directory: path -> size, mtime and content hash.
+
+    Built by one directory scan on first use, then kept current by the write paths
+    (write_file, POST /api/file), so listing never walks the disk again. The digest is an
+    XOR of per-file tokens, updated in O(1) per change.
+    """
+
+    def __init__(self, root: pathlib.Path):
+        self.root = root
+        self._resolved_root = root.resolve()
+        self.version = 0
+        self._entries: Dict[str, ManifestEntry] = {}
+        self._digest = 0
+        self._built = False
+        self._listing: Optional[List[ManifestEntry]] = None
+        self._lock = threading.RLock()
+
+    def relative_path(self, path: Union[str, pathlib.Path]) -> str:
+        p = pathlib.Path(path)
+        if p.is_absolute():
+            p = p.resolve().relative_to(self._resolved_root)
+        rel = posixpath.normpath(p.as_posix())
+        return "" if rel == "." else rel
+
+    def rebuild(self):
+        """Cold rebuild from disk."""
+        with self._lock:
+            self._entries = {}
+            self._digest = 0
+            if self.root.exists():
+                for file_path in self.root.rglob("*"):
+                    if file_path.is_file():
+                        self._put(self._entry_from_disk(file_path))
+            self._built = True
+            self._changed()
+
+    def mark_stale(self):
+        """Forget the index; the next read rebuilds it (e.g. after a shell command ran in the project)."""
+        with self._lock:
+            self._built = False
+
+    def _ensure_built(self):
+        if not self._built:
+            self.rebuild()
+
+    def _entry_from_disk(self, file_path: pathlib.Path) -> ManifestEntry:
+        data = file_path.read_bytes()
+        stat = file_path.stat()
+        return ManifestEntry(self.relative_path(file_path), stat.st_size, stat.st_mtime, hashlib.sha256(data).hexdigest())
+
+    def _put(self, entry: ManifestEntry):
+        old = self._entries.get(entry.path)
+        if old is not None:
+            self._digest ^= _entry_token(old)
+        self._entries[entry.path] = entry
+        self._digest ^= _entry_token(entry)
+
+    def _changed(self):
+        self.version += 1
+        self._listing = None
+
+    def record_write(self, file_path: pathlib.Path, data: Union[str, bytes]) -> ManifestEntry:
+        """Update the index after writing `data` to `file_path`; hashes the in-memory data, no re-read."""
+        raw = data.encode("utf-8") if isinstance(data, str) else data
+        stat = file_path.stat()
+        entry = ManifestEntry(self.relative_path(file_path), len(raw), stat.st_mtime, hashlib.sha256(raw).hexdigest())
+        with self._lock:
+            self._ensure_built()
+            self._put(entry)
+            self._changed()
+        return entry
+
+    def refresh(self, file_path: pathlib.Path) -> Optional[ManifestEntry]:
+        """Update the index for a file changed by someone else (re-reads just that file)."""
+        with self._lock:
+            self._ensure_built()
+            path = self.relative_path(file_path)
+            if file_path.is_file():
+                entry = self._entry_from_disk(file_path)
+                self._put(entry)
+            else:
+                entry = None
+                old = self._entries.pop(path, None)
+                if old is not None:
+                    self._digest ^= _entry_token(old)
+            self._changed()
+            return entry
+
+    def get(self, path: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            self._ensure_built()
+            return self._entries.get(path)
+
+    def peek(self, path: str) -> Optional[ManifestEntry]:
+        """Like `get`, but never reads the disk: None while the index is not built."""
+        with self._lock:
+            return self._entries.get(path) if self._built else None
+
+    def entries(self, directory: str = "") -> List[ManifestEntry]:
+        """Entries sorted by path, optionally limited to one directory (recursively)."""
+        with self._lock:
+            self._ensure_built()
+            if self._listing is None:
+                self._listing = [self._entries[path] for path in sorted(self._entries)]
+            listing = self._listing
+        prefix = directory.strip("/")
+        if prefix in ("", "."):
+            return listing
+        return [e for e in listing if e.path.startswith(prefix + "/")]
+
+    def digest(self) -> str:
+        """Content digest of the whole project; changes whenever any file is added or changes."""
+        with self._lock:
+            self._ensure_built()
+            return f"{self._digest:016x}-{len(self._entries)}"
+
+
+# Manifests of the most recently used projects; an evicted one is rebuilt from disk on next use
+MANIFEST_CACHE_SIZE = int(os.getenv("MANIFEST_CACHE_SIZE", "256"))
+_manifests: "OrderedDict[str, ProjectManifest]" = OrderedDict()
+_manifests_lock = threading.Lock()
+
+
+def manifest_for(root: pathlib.Path) -> ProjectManifest:
+    """The process-wide manifest for a project root."""
+    key = str(root.resolve())
+    with _manifests_lock:
+        manifest = _manifests.get(key)
+        if manifest is None:
+            manifest = _manifests[key] = ProjectManifest(root)
+            while len(_manifests) > max(1, MANIFEST_CACHE_SIZE):
+                _manifests.popitem(last=False)
+        else:
+            _manifests.move_to_end(key)
+        return manifest
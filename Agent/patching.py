@@ -0,0 +1,176 @@
+import difflib
+import re
+from typing import List, Optional, Tuple
+
+# Fuzzy matches must be at least this similar (difflib ratio over the joined lines)
+FUZZY_MATCH_RATIO = 0.9
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+_SEARCH_MARKER = re.compile(r"^<{5,} ?SEARCH\s*$")
+_DIVIDER_MARKER = re.compile(r"^={5,}\s*$")
+_REPLACE_MARKER = re.compile(r"^>{5,} ?REPLACE\s*$")
+
+
+class PatchError(ValueError):
+    """A patch that does not apply; the message says which part and why, for the model to retry."""
+
+
+def _find_block(lines: List[str], block: List[str], hint: int = 0) -> Tuple[int, int]:
+    """Locate `block` in `lines` and return (start, end) of the matched line range.
+
+    Tries an exact match (the one nearest `hint` wins), then one ignoring indentation and
+    trailing whitespace, then the most similar window of the same length. A looser match
+    must be unique.
+    """
+    n = len(block)
+    if n == 0:
+        raise PatchError("empty search block")
+    starts = range(len(lines) - n + 1)
+
+    exact = [i for i in starts if lines[i:i + n] == block]
+    if exact:
+        start = min(exact, key=lambda i: abs(i - hint))
+        return start, start + n
+
+    stripped = [line.strip() for line in block]
+    loose = [i for i in starts if [line.strip() for line in lines[i:i + n]] == stripped]
+    if len(loose) == 1:
+        return loose[0], loose[0] + n
+    if len(loose) > 1:
+        raise PatchError(f"search block matches {len(loose)} places; include more surrounding lines")
+
+    target = "\n".join(stripped)
+    scored = []
+    for i in starts:
+        ratio = difflib.SequenceMatcher(None, "\n".join(line.strip() for line in lines[i:i + n]), target).ratio()
+        if ratio >= FUZZY_MATCH_RATIO:
+            scored.append((ratio, i))
+    if not scored:
+        preview = "\n".join(block[:3])
+        raise PatchError(f"search block not found in the file (first lines: {preview!r})")
+    scored.sort(reverse=True)
+    if len(scored) > 1 and scored[1][0] == scored[0][0]:
+        raise PatchError("search block is ambiguous; include more surrounding lines")
+    return scored[0][1], scored[0][1] + n
+
+
+def _join(lines: List[str], trailing_newline: bool) -> str:
+    text = "\n".join(lines)
+    return text + "\n" if trailing_newline and lines else text
+
+
+def replace_block(content: str, search: str, replace: str) -> str:
+    """Replace the part of `content` matching `search` (exactly, or fuzzily by lines)."""
+    if search and content.count(search) == 1:
+        return content.replace(search, replace, 1)
+    if search and content.count(search) > 1:
+        raise PatchError(f"search text matches {content.count(search)} places; include more surrounding lines")
+    lines = content.splitlines()
+    start, end = _find_block(lines, search.strip("\n").splitlines())
+    replacement = replace.strip("\n").splitlines() if replace.strip("\n") else []
+    return _join(lines[:start] + replacement + lines[end:], content.endswith("\n"))
+
+
+def parse_search_replace(patch: str) -> Optional[List[Tuple[str, str]]]:
+    """(search, replace) pairs from SEARCH/REPLACE blocks, or None if `patch` has none."""
+    blocks, search, replace, state = [], [], [], None
+    for line in patch.splitlines():
+        if _SEARCH_MARKER.match(line):
+            search, replace, state = [], [], "search"
+        elif _DIVIDER_MARKER.match(line) and state == "search":
+            state = "replace"
+        elif _REPLACE_MARKER.match(line) and state == "replace":
+            blocks.append(("\n".join(search), "\n".join(replace)))
+            state = None
+        elif state == "search":
+            search.append(line)
+        elif state == "replace":
+            replace.append(line)
+    if state is not None:
+        raise PatchError("unterminated SEARCH/REPLACE block")
+    return blocks or None
+
+
+def _parse_hunks(patch: str) -> List[Tuple[int, List[str], List[str]]]:
+    """(hint, old lines, new lines) per hunk; the header's line counts say where each hunk ends."""
+    hunks: List[Tuple[int, List[str], List[str]]] = []
+    lines = patch.splitlines()
+    i = 0
+    while i < len(lines):
+        header = _HUNK_HEADER.match(lines[i])
+        i += 1
+        if not header:
+            # File headers, fences and prose between hunks
+            continue
+        number = len(hunks) + 1
+        old_count = int(header.group(2)) if header.group(2) is not None else 1
+        new_count = int(header.group(3)) if header.group(3) is not None else 1
+        old: List[str] = []
+        new: List[str] = []
+        while len(old) < old_count or len(new) < new_count:
+            if i == len(lines):
+                raise PatchError(f"hunk {number}: ends after {len(old)} old and {len(new)} new lines, "
+                                 f"but its header says {old_count} and {new_count}")
+            line = lines[i]
+            i += 1
+            if line.startswith("\\"):
+                continue
+            if line.startswith("-"):
+                old.append(line[1:])
+            elif line.startswith("+"):
+                new.append(line[1:])
+            elif line.startswith(" ") or line == "":
+                # Context line; some models drop the leading space of blank context lines
+                old.append(line[1:])
+                new.append(line[1:])
+            else:
+                raise PatchError(f"hunk {number}: unexpected line {line!r}; every line needs a ' ', '-' or '+' prefix")
+            if len(old) > old_count or len(new) > new_count:
+                raise PatchError(f"hunk {number}: has more lines than its header says "
+                                 f"({old_count} old, {new_count} new)")
+        while i < len(lines) and lines[i].startswith("\\"):
+            i += 1
+        if i < len(lines) and lines[i].startswith((" ", "-", "+")) and not lines[i].startswith(("--- ", "+++ ")):
+            raise PatchError(f"hunk {number}: has more lines than its header says ({old_count} old, {new_count} new)")
+        hunks.append((int(header.group(1)) - 1, old, new))
+    return hunks
+
+
+def apply_unified_diff(content: str, patch: str) -> str:
+    """Apply the hunks of a unified diff to `content`; line numbers are only used as hints.
+
+    Nothing is applied unless every hunk matches its header's line counts and the file.
+    """
+    lines = content.splitlines()
+    hunks = _parse_hunks(patch)
+    if not hunks:
+        raise PatchError("no hunks found; expected a unified diff with @@ lines or SEARCH/REPLACE blocks")
+
+    offset = 0
+    for number, (hint, old, new) in enumerate(hunks, 1):
+        if not old:
+            # Pure insertion at the hinted line
+            at = max(0, min(len(lines), hint + 1 + offset))
+            lines[at:at] = new
+            offset += len(new)
+            continue
+        try:
+            start, end = _find_block(lines, old, hint + offset)
+        except PatchError as e:
+            raise PatchError(f"hunk {number}: {e}")
+        lines[start:end] = new
+        offset += len(new) - (end - start)
+    return _join(lines, content.endswith("\n") or not content)
+
+
+def apply_patch(content: str, patch: str) -> str:
+    """Apply SEARCH/REPLACE blocks or a unified diff to `content`; raises PatchError on mismatch."""
+    blocks = parse_search_replace(patch)
+    if blocks is None:
+        return apply_unified_diff(content, patch)
+    for number, (search, replace) in enumerate(blocks, 1):
+        try:
+            content = replace_block(content, search, replace)
+        except PatchError as e:
+            raise PatchError(f"block {number}: {e}")
+    return content
@@ -0,0 +1,234 @@
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+# Stop-words and request phrasing; everything else (including "app", "list", "script") is content
+_STOP_WORDS = {
+    "a", "an", "the", "to", "for", "of", "with", "using", "and", "that", "which", "in", "on", "it",
+    "is", "me", "my", "please", "i", "want", "need", "would", "like", "can", "you", "create", "build", "make", "write",
+    "generate", "develop", "implement",
+}
+
+# Words naming a platform, language, framework or kind of artifact, and negations: prompts that
+# differ in any of these ask for a different project however similar the rest is
+_KEY_WORDS = {
+    "web", "website", "webapp", "page", "app", "application", "script", "tool", "cli", "command",
+    "terminal", "api", "server", "backend", "frontend", "game", "bot", "extension", "library",
+    "desktop", "mobile", "android", "ios", "python", "javascript", "js", "typescript", "ts", "html",
+    "css", "java", "kotlin", "swift", "go", "rust", "c", "c++", "c#", "php", "ruby", "sql", "react",
+    "vue", "angular", "svelte", "next", "node", "express", "flask", "django", "fastapi", "tailwind",
+    "bootstrap", "jquery", "sqlite", "postgres", "postgresql", "mysql", "mongodb", "firebase",
+    "no", "not", "without", "don", "never",
+}
+
+
+def normalize_prompt(prompt: str) -> list[str]:
+    """Lowercase, join split words ('to-do', 'web app'), drop stop-words and plural 's'."""
+    text = re.sub(r"(\w)-(\w)", r"\1\2", prompt.lower())
+    text = re.sub(r"\bto do\b", "todo", text)
+    text = re.sub(r"\bweb app\b", "webapp", text)
+    words = []
+    for word in re.findall(r"[a-z0-9+#]+", text):
+        if word in _STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def key_words(words: list[str]) -> frozenset:
+    """The words of a normalized prompt that name its platform, language or artifact, or negate."""
+    return frozenset(word for word in words if word in _KEY_WORDS)
+
+
+class HashingEmbedder:
+    """Maps a prompt to a unit vector of hashed word and character-trigram features (no network, no fit)."""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, words: list[str]):
+        for word in words:
+            yield f"w:{word}", 1.0
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                yield f"c:{padded[i:i + 3]}", 0.5
+        for first, second in zip(words, words[1:]):
+            yield f"b:{first} {second}", 0.5
+
+    def embed(self, prompt: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(normalize_prompt(prompt)):
+            h = zlib.crc32(feature.encode("utf-8"))
+            # The top bit picks the sign so collisions cancel out instead of piling up
+            vec[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+
+@dataclass
+class PlanCacheHit:
+    entry_id: int
+    similarity: float
+    prompt: str
+    plan: dict
+    task_plan: Optional[dict]
+
+
+class SemanticPlanCache:
+    """Reuses plans across near-duplicate prompts via cosine similarity over hashed prompt embeddings.
+
+    Embeddings live in one preallocated NumPy matrix, so a lookup is a single matrix-vector product.
+    Entries are persisted to SQLite and re-embedded on start-up.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.85, dim: int = 256, max_entries: int = 5000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embedder = HashingEmbedder(dim)
+        self.hits = 0
+        self.misses = 0
+        # Similar enough by cosine, but asking for something else (another stack, a negation...)
+        self.rejected = 0
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((64, dim), dtype=np.float32)
+        self._ids: list[int] = []
+        self._entries: dict[int, dict] = {}
+        self._next_id = 1  # only used without a database, which assigns ids otherwise
+        self._conn = None
+        if path:
+            pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS plans (id INTEGER PRIMARY KEY, prompt TEXT NOT NULL,"
+                " plan TEXT NOT NULL, task_plan TEXT, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+            self._load()
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT id, prompt, plan, task_plan FROM plans ORDER BY id DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for entry_id, prompt, plan, task_plan in reversed(rows):
+            self._insert(entry_id, prompt, json.loads(plan), json.loads(task_plan) if task_plan else None)
+
+    def _insert(self, entry_id: int, prompt: str, plan: dict, task_plan: Optional[dict]):
+        if len(self._ids) >= self.max_entries:
+            self._remove_row(0)
+        row = len(self._ids)
+        if row == len(self._matrix):
+            self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+        self._matrix[row] = self.embedder.embed(prompt)
+        self._ids.append(entry_id)
+        self._entries[entry_id] = {"prompt": prompt, "plan": plan, "task_plan": task_plan,
+                                   "key_words": key_words(normalize_prompt(prompt))}
+
+    def _remove_row(self, row: int):
+        """Drop an entry, keeping the matrix rows contiguous and in insertion order."""
+        entry_id = self._ids.pop(row)
+        self._entries.pop(entry_id, None)
+        count = len(self._ids)
+        self._matrix[row:count] = self._matrix[row + 1:count + 1]
+        self._matrix[count] = 0
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM plans WHERE id = ?", (entry_id,))
+
+    def lookup(self, prompt: str) -> Optional[PlanCacheHit]:
+        """Return the most similar cached plan that clears the threshold and asks for the same thing.
+
+        The cosine threshold decides how alike the prompts must be. It would still score "... in
+        React" and "... in Vue" (or "... without local storage") as near-duplicates, so a hit must
+        also name the same platforms, languages and artifacts and have the same negations.
+        """
+        query = self.embedder.embed(prompt)
+        words = key_words(normalize_prompt(prompt))
+        with self._lock:
+            count = len(self._ids)
+            if count and query.any():
+                scores = self._matrix[:count] @ query
+                candidates = np.flatnonzero(scores >= self.threshold)
+                for row in candidates[np.argsort(-scores[candidates])]:
+                    entry_id = self._ids[int(row)]
+                    entry = self._entries[entry_id]
+                    if entry["key_words"] != words:
+                        continue
+                    self.hits += 1
+                    return PlanCacheHit(entry_id, float(scores[row]), entry["prompt"], entry["plan"], entry["task_plan"])
+                if len(candidates):
+                    self.rejected += 1
+            self.misses += 1
+            return None
+
+    def add(self, prompt: str, plan: dict) -> int:
+        """Store the plan for a prompt and return its entry id."""
+        with self._lock:
+            if self._conn is not None:
+                # SQLite assigns the id, so processes sharing the file never hand out the same one
+                cursor = self._conn.execute(
+                    "INSERT INTO plans (prompt, plan, created_at) VALUES (?, ?, ?)",
+                    (prompt, json.dumps(plan), time.time()),
+                )
+                self._conn.commit()
+                entry_id = cursor.lastrowid
+            else:
+                entry_id = self._next_id
+                self._next_id += 1
+            self._insert(entry_id, prompt, plan, None)
+            return entry_id
+
+    def attach_task_plan(self, entry_id: int, task_plan: dict):
+        """Remember the architect's task plan for a cached plan."""
+        with self._lock:
+            if entry_id not in self._entries:
+                return
+            self._entries[entry_id]["task_plan"] = task_plan
+            if self._conn is not None:
+                self._conn.execute("UPDATE plans SET task_plan = ? WHERE id = ?", (json.dumps(task_plan), entry_id))
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._ids),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_plan_cache: Optional[SemanticPlanCache] = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache() -> Optional[SemanticPlanCache]:
+    """Return the process-wide plan cache configured from the environment.
+
+    PLAN_CACHE_PATH (default .cache/plan_cache.sqlite; "off" disables the cache, empty keeps it
+    in memory only), PLAN_CACHE_THRESHOLD (cosine similarity, default 0.85) and PLAN_CACHE_MAX_ENTRIES.
+    """
+    global _plan_cache
+    with _plan_cache_lock:
+        if _plan_cache is None:
+            path = os.getenv("PLAN_CACHE_PATH", ".cache/plan_cache.sqlite")
+            if path.lower() == "off":
+                return None
+            _plan_cache = SemanticPlanCache(
+                path or None,
+                threshold=float(os.getenv("PLAN_CACHE_THRESHOLD", "0.85")),
+                max_entries=int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "5000")),
+            )
+        return _plan_cache
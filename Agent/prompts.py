@@ -18,6 +18,8 @@ def architect_prompt(plan: str) -> str:
         * Name the variables, functions, classes, and components to be defined.
         * Mention how this task depends on or will be used by previous tasks.
         * Include integration details: imports, expected function signatures, data flow.
+    - In each task's depends_on, list the paths of the OTHER project files the task reads or imports.
+      Leave it empty when the file does not need any other file, so it can be implemented in parallel.
     - Order tasks so that dependencies are implemented first.
     - Each step must be SELF-CONTAINED but also carry FORWARD the relevant context from earlier tasks.
     
@@ -29,11 +31,12 @@ def coder_system_prompt() -> str:
     CODER_SYSTEM_PROMPT = """
 You are the CODER agent.
 You are implementing a specific engineering task.
-You have access to tools to read and write files.
+You have access to tools to read, write and edit files.
 
 Always:
 - Review all existing files to maintain compatibility.
-- Implement the FULL file content, integrating with other modules.
+- Implement the FULL file content of new files, integrating with other modules.
+- Change existing files with edit_file or apply_patch, sending only the lines that change.
 - Maintain consistent naming of variables, functions, and imports.
 - When a module is imported from another file, ensure it exists and is implemented as described.
     """
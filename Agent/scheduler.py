@@ -0,0 +1,114 @@
+import os
+import posixpath
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from .states import ImplementationTask
+
+# Upper bound on implementation steps the coder runs at the same time
+CODER_MAX_WORKERS = max(1, int(os.getenv("CODER_MAX_WORKERS", "4")))
+# Merge steps on the same file into one coder call (STEP_FUSION=0 keeps the architect's steps)
+STEP_FUSION = os.getenv("STEP_FUSION", "1") == "1"
+# Largest fused task description, in estimated tokens (about 4 characters each)
+STEP_FUSION_MAX_TOKENS = int(os.getenv("STEP_FUSION_MAX_TOKENS", "1500"))
+
+
+def _normalize_path(path: str) -> str:
+    """Normalize a project-relative path so 'src/./app.js' and 'src/app.js' compare equal."""
+    return posixpath.normpath(path.replace("\\", "/").strip()).lstrip("/")
+
+
+def step_dependencies(steps: List[ImplementationTask]) -> List[Set[int]]:
+    """For each step, the indices of earlier steps that must finish before it can start.
+
+    A step waits for the last earlier step writing the same file (so edits to one file stay
+    in plan order) and for the last earlier step writing any file it lists in depends_on.
+    Only earlier steps are considered, so the result is always acyclic.
+    """
+    last_writer = {}
+    dependencies = []
+    for idx, step in enumerate(steps):
+        target = _normalize_path(step.filepath)
+        needed = set()
+        for path in [target, *step.depends_on]:
+            writer = last_writer.get(_normalize_path(path))
+            if writer is not None:
+                needed.add(writer)
+        dependencies.append(needed)
+        last_writer[target] = idx
+    return dependencies
+
+
+def run_plan(steps: List[ImplementationTask], completed: Iterable[int], worker: Callable[[int], object],
+             max_workers: int = CODER_MAX_WORKERS,
+             on_done: Optional[Callable[[int, object], None]] = None) -> Dict[int, object]:
+    """Run `worker(idx)` for every pending step, each as soon as its dependencies are done.
+
+    Up to `max_workers` steps run at once; a finished step frees its worker straight away and
+    unblocks the steps waiting on it, so one slow step never holds back unrelated ones.
+    `on_done(idx, result)` runs in the calling thread as each step finishes. Returns the
+    results by step index.
+    """
+    done = set(completed)
+    dependencies = step_dependencies(steps)
+    pending = [idx for idx in range(len(steps)) if idx not in done]
+    results: Dict[int, object] = {}
+    max_workers = max(1, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="coder-step") as pool:
+        running = {}
+        while pending or running:
+            for idx in [idx for idx in pending if dependencies[idx] <= done][:max_workers - len(running)]:
+                pending.remove(idx)
+                # Copy the caller's context so tools see the same session in every worker thread
+                running[pool.submit(copy_context().run, worker, idx)] = idx
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                idx = running.pop(future)
+                results[idx] = future.result()
+                done.add(idx)
+                if on_done is not None:
+                    on_done(idx, results[idx])
+    return results
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def fuse_steps(steps: List[ImplementationTask], max_tokens: int = STEP_FUSION_MAX_TOKENS) -> List[ImplementationTask]:
+    """Merge later steps on a file into the first step on it, so the file is generated once.
+
+    A step is folded into the earlier step on its file unless a step in between writes a file
+    it depends on (the fused step would then have to wait for itself), or the combined task
+    descriptions would exceed `max_tokens`. Dependencies are merged; the fused step keeps
+    the position of the first one, so the plan stays acyclic.
+    """
+    fused: List[dict] = []
+    open_step = {}  # normalized path -> index in `fused` of the step later ones may join
+    for step in steps:
+        target = _normalize_path(step.filepath)
+        needs = {_normalize_path(path) for path in step.depends_on} - {target}
+        idx = open_step.get(target)
+        if idx is not None:
+            candidate = fused[idx]
+            between = {_normalize_path(s["filepath"]) for s in fused[idx + 1:]}
+            tasks = candidate["tasks"] + [step.task_description]
+            if not (needs & between) and _estimate_tokens("\n".join(tasks)) <= max_tokens:
+                candidate["tasks"] = tasks
+                for path in step.depends_on:
+                    if _normalize_path(path) != target and path not in candidate["depends_on"]:
+                        candidate["depends_on"].append(path)
+                continue
+        open_step[target] = len(fused)
+        fused.append({"filepath": step.filepath, "tasks": [step.task_description], "depends_on": list(step.depends_on)})
+
+    return [
+        ImplementationTask(
+            filepath=s["filepath"],
+            task_description=s["tasks"][0] if len(s["tasks"]) == 1
+            else "\n".join(f"{n}. {task}" for n, task in enumerate(s["tasks"], 1)),
+            depends_on=s["depends_on"],
+        )
+        for s in fused
+    ]
@@ -1,5 +1,7 @@
+import operator
+
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import Annotated, List, TypedDict
 
 class File(BaseModel):
     file_path:str= Field(description="Path to the file to be created")
@@ -15,13 +17,31 @@ class Plan(BaseModel):
 class ImplementationTask(BaseModel):
     filepath: str=Field(description="path to the file to be modified")
     task_description:str=Field(description="a detailed description of task to be performed, e.g 'add user authentication', 'implement data processing logic', etc")
+    depends_on: list[str]=Field(default_factory=list, description="paths of other project files this task reads or imports, e.g ['src/utils.js', 'styles.css']; empty if the file is self-contained")
 
 class TaskPlan(BaseModel):
     implementation_steps: list[ImplementationTask]=Field(description="The list of steps for implementations of task")
     model_config = ConfigDict(extra="allow")
 
-class CoderState(BaseModel):
-    task_plan: TaskPlan = Field(description="The plan for the task to be implemented")
-    current_step_idx: int = Field(0, description="The index of the current step in the implementation steps")
-    current_file_content: Optional[str] = Field(None, description="The content of the file currently being edited or created")
+class FileWrite(TypedDict):
+    path: str
+    size: int
+    sha256: str
+
+class StepResult(TypedDict):
+    step_index: int
+    filepath: str
+    success: bool
+    writes: List[FileWrite]
 
+class GraphState(TypedDict, total=False):
+    """State of one run. The task plan is written once by the architect; the coder only
+    appends the steps it finished, so no node re-sends the whole plan."""
+    user_prompt: str
+    plan: dict
+    plan_cache_id: int
+    cached_task_plan: dict
+    task_plan: dict
+    task_plan_id: str
+    completed_steps: Annotated[List[int], operator.add]
+    step_results: Annotated[List[StepResult], operator.add]
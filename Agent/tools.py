@@ -1,29 +1,84 @@
 import pathlib
+import posixpath
 import subprocess
-from typing import Tuple, Optional, Callable
-import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import List, Tuple, Optional, Callable
 
 from langchain_core.tools import tool
 
-# Global event emitter for file operations
-_event_emitter: Optional[Callable[[str, dict], None]] = None
-_session_id: Optional[str] = None
+from .manifest import ManifestEntry, ProjectManifest, manifest_for
+from .patching import PatchError, apply_patch as apply_patch_text, replace_block
+
+
+@dataclass(frozen=True)
+class ToolContext:
+    """The session the tools operate on and where their events go."""
+    session_id: str
+    event_emitter: Optional[Callable[[str, dict], None]] = None
+
+
+# Context-local (not process-global) so concurrent sessions in one process never share it.
+# LangGraph and the coder scheduler copy the context into their worker threads.
+_tool_context: ContextVar[Optional[ToolContext]] = ContextVar("tool_context", default=None)
+
+
+def set_event_emitter(emitter: Optional[Callable[[str, dict], None]], session_id: str):
+    """Set the event emitter function and session ID for the current context."""
+    return _tool_context.set(ToolContext(session_id=session_id, event_emitter=emitter))
+
+
+@dataclass
+class StepWrites:
+    """Files written while one coder step runs, in order, as recorded by write_file."""
+    writes: List[ManifestEntry] = field(default_factory=list)
+
+    def last_write(self, path: str) -> Optional[ManifestEntry]:
+        """The step's latest write to the project-relative `path`, if any."""
+        path = posixpath.normpath(pathlib.PurePath(path).as_posix())
+        for entry in reversed(self.writes):
+            if entry.path == path:
+                return entry
+        return None
+
+
+# Set by track_writes(); the copies of the context LangGraph makes for tool calls share the same record
+_step_writes: ContextVar[Optional[StepWrites]] = ContextVar("step_writes", default=None)
+
+
+@contextmanager
+def track_writes():
+    """Record the write_file calls made in this context (and threads it is copied to)."""
+    writes = StepWrites()
+    token = _step_writes.set(writes)
+    try:
+        yield writes
+    finally:
+        _step_writes.reset(token)
+
+
+def _require_session_id() -> str:
+    ctx = _tool_context.get()
+    if ctx is None or not ctx.session_id:
+        raise ValueError("Session ID not set. Call set_event_emitter first.")
+    return ctx.session_id
 
-def set_event_emitter(emitter: Callable[[str, dict], None], session_id: str):
-    """Set the event emitter function and session ID for this thread."""
-    global _event_emitter, _session_id
-    _event_emitter = emitter
-    _session_id = session_id
 
 def emit_event(event_type: str, data: dict):
     """Emit an event if emitter is set."""
-    if _event_emitter and _session_id:
-        _event_emitter(_session_id, {"type": event_type, **data})
+    ctx = _tool_context.get()
+    if ctx and ctx.event_emitter and ctx.session_id:
+        ctx.event_emitter(ctx.session_id, {"type": event_type, **data})
 
 def get_project_root(session_id: str) -> pathlib.Path:
     """Get the project root for a specific session."""
     return pathlib.Path.cwd() / "generated_project" / session_id
 
+def get_manifest(session_id: str) -> ProjectManifest:
+    """Get the in-memory file manifest of a session's project."""
+    return manifest_for(get_project_root(session_id))
+
 def safe_path_for_project(path: str, session_id: str) -> pathlib.Path:
     project_root = get_project_root(session_id)
     p = (project_root / path).resolve()
@@ -32,30 +87,75 @@ def safe_path_for_project(path: str, session_id: str) -> pathlib.Path:
     return p
 
 
-@tool
-def write_file(path: str, content: str) -> str:
-    """Writes content to a file at the specified path within the project root."""
-    if not _session_id:
-        raise ValueError("Session ID not set. Call set_event_emitter first.")
-    
-    p = safe_path_for_project(path, _session_id)
+def _write_project_file(session_id: str, path: str, content: str, action: str = "write") -> str:
+    p = safe_path_for_project(path, session_id)
     p.parent.mkdir(parents=True, exist_ok=True)
     with open(p, "w", encoding="utf-8") as f:
         f.write(content)
+    entry = get_manifest(session_id).record_write(p, content)
+    writes = _step_writes.get()
+    if writes is not None:
+        writes.writes.append(entry)
     
     # Emit file write event
-    emit_event("file", {"path": path, "action": "write", "size": len(content)})
+    emit_event("file", {"path": path, "action": action, "size": len(content)})
     
-    return f"WROTE:{p}"
+    # Project-relative so the follow-up LLM call is identical across sessions (and cacheable)
+    return f"WROTE:{path}"
+
+
+@tool
+def write_file(path: str, content: str) -> str:
+    """Writes content to a file at the specified path within the project root."""
+    session_id = _require_session_id()
+    return _write_project_file(session_id, path, content)
+
+
+def _edit_project_file(path: str, edit: Callable[[str], str]) -> str:
+    session_id = _require_session_id()
+    p = safe_path_for_project(path, session_id)
+    if not p.is_file():
+        return f"ERROR: {path} does not exist; create it with write_file"
+    with open(p, "r", encoding="utf-8") as f:
+        content = f.read()
+    try:
+        new_content = edit(content)
+    except PatchError as e:
+        return f"ERROR: {path} was not changed: {e}"
+    if new_content == content:
+        return f"ERROR: {path} was not changed: the edit leaves it identical"
+    return _write_project_file(session_id, path, new_content, action="edit")
+
+
+@tool
+def edit_file(path: str, search: str, replace: str) -> str:
+    """Replaces the lines of an existing file that match `search` with `replace`.
+
+    `search` must be copied from the file, with enough lines to match one place only. Much
+    cheaper than rewriting the whole file with write_file for small changes.
+    """
+    return _edit_project_file(path, lambda content: replace_block(content, search, replace))
+
+
+@tool
+def apply_patch(path: str, patch: str) -> str:
+    """Applies a patch to an existing file: a unified diff (the line counts in each @@ header
+    must match the hunk), or one or more blocks of the form
+    <<<<<<< SEARCH
+    lines copied from the file
+    =======
+    replacement lines
+    >>>>>>> REPLACE
+    Nothing is written if any part does not apply; the error says which one.
+    """
+    return _edit_project_file(path, lambda content: apply_patch_text(content, patch))
 
 
 @tool
 def read_file(path: str) -> str:
     """Reads content from a file at the specified path within the project root."""
-    if not _session_id:
-        raise ValueError("Session ID not set. Call set_event_emitter first.")
-    
-    p = safe_path_for_project(path, _session_id)
+    session_id = _require_session_id()
+    p = safe_path_for_project(path, session_id)
     if not p.exists():
         return ""
     with open(p, "r", encoding="utf-8") as f:
@@ -65,32 +165,30 @@ def read_file(path: str) -> str:
 @tool
 def get_current_directory() -> str:
     """Returns the current working directory."""
-    if not _session_id:
-        raise ValueError("Session ID not set. Call set_event_emitter first.")
-    
-    return str(get_project_root(_session_id))
+    session_id = _require_session_id()
+    return str(get_project_root(session_id))
 
 
 @tool
 def list_files(directory: str = ".") -> str:
     """Lists all files in the specified directory within the project root."""
-    if not _session_id:
-        raise ValueError("Session ID not set. Call set_event_emitter first.")
-    
-    p = safe_path_for_project(directory, _session_id)
+    session_id = _require_session_id()
+    p = safe_path_for_project(directory, session_id)
     if not p.is_dir():
         return f"ERROR: {p} is not a directory"
-    files = [str(f.relative_to(get_project_root(_session_id))) for f in p.glob("**/*") if f.is_file()]
+    # Served from the manifest index instead of walking the directory on every call
+    directory = get_manifest(session_id).relative_path(p)
+    files = [entry.path for entry in get_manifest(session_id).entries(directory)]
     return "\n".join(files) if files else "No files found."
 
 @tool
 def run_cmd(cmd: str, cwd: str = None, timeout: int = 30) -> Tuple[int, str, str]:
     """Runs a shell command in the specified directory and returns the result."""
-    if not _session_id:
-        raise ValueError("Session ID not set. Call set_event_emitter first.")
-    
-    cwd_dir = safe_path_for_project(cwd, _session_id) if cwd else get_project_root(_session_id)
+    session_id = _require_session_id()
+    cwd_dir = safe_path_for_project(cwd, session_id) if cwd else get_project_root(session_id)
     res = subprocess.run(cmd, shell=True, cwd=str(cwd_dir), capture_output=True, text=True, timeout=timeout)
+    # The command may have created or changed any file
+    get_manifest(session_id).mark_stale()
     return res.returncode, res.stdout, res.stderr
 
 
@@ -98,4 +196,6 @@ def init_project_root(session_id: str):
     """Initialize project root for a specific session."""
     project_root = get_project_root(session_id)
     project_root.mkdir(parents=True, exist_ok=True)
+    # Cold (re)build of the file index from whatever is already on disk
+    get_manifest(session_id).rebuild()
     return str(project_root)
\ No newline at end of file
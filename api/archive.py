@@ -0,0 +1,173 @@
+import os
+import pathlib
+import threading
+import uuid
+import zipfile
+from typing import Dict, Iterator, Optional, Tuple
+
+from Agent.manifest import manifest_for
+
+# Formats that are already compressed; deflating them again costs CPU for no size gain
+STORED_SUFFIXES = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".ico",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar", ".jar", ".whl",
+    ".woff", ".woff2", ".mp3", ".mp4", ".webm", ".ogg", ".pdf",
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that buffers what ZipFile writes until it is drained.
+
+    Because it cannot seek, ZipFile streams each entry with a trailing data descriptor
+    instead of going back to patch the local header.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_project_files(project_path: pathlib.Path) -> Iterator[pathlib.Path]:
+    """All files under a project directory, in a stable order."""
+    return (p for p in sorted(project_path.rglob("*")) if p.is_file())
+
+
+def iter_zip(project_path: pathlib.Path, store_only: bool = False, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a ZIP archive of a project directory chunk by chunk.
+
+    Memory stays bounded by `chunk_size` plus one compressor window, whatever the project size.
+    Already-compressed formats are stored as-is; `store_only` stores every file.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for file_path in iter_project_files(project_path):
+            zinfo = zipfile.ZipInfo.from_file(file_path, file_path.relative_to(project_path).as_posix())
+            if store_only or file_path.suffix.lower() in STORED_SUFFIXES:
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+            with open(file_path, "rb") as src, zip_file.open(zinfo, "w") as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory, written when the archive is closed
+    data = sink.drain()
+    if data:
+        yield data
+
+
+class ZipArtifactCache:
+    """Keeps the last built ZIP of each session on disk so repeat downloads skip re-compression.
+
+    The ETag is the project manifest's content digest (suffixed for store_only archives). The
+    artifact and its ETag stay valid until `invalidate` is called for the session, which happens
+    whenever write_file or POST /api/file touches one of its files. Once the directory holds more
+    than `max_bytes`, the least recently used artifacts are deleted.
+    """
+
+    def __init__(self, root: pathlib.Path, max_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._artifacts: Dict[Tuple[str, bool], Tuple[str, pathlib.Path]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _artifact_path(self, session_id: str, etag: str) -> pathlib.Path:
+        return self.root / f"{session_id}-{etag}.zip"
+
+    def _trim(self, keep: pathlib.Path):
+        """Delete the least recently used artifacts until the directory fits in `max_bytes`."""
+        artifacts = []
+        for path in self.root.glob("*.zip"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            artifacts.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in artifacts)
+        for _, size, path in sorted(artifacts):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+        self._artifacts = {key: value for key, value in self._artifacts.items() if value[1].exists()}
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._generations[session_id] = self._generations.get(session_id, 0) + 1
+            stale = [key for key in self._artifacts if key[0] == session_id]
+            for key in stale:
+                _, path = self._artifacts.pop(key)
+                path.unlink(missing_ok=True)
+
+    def lookup(self, session_id: str, project_path: pathlib.Path, store_only: bool = False) -> Tuple[str, Optional[pathlib.Path]]:
+        """Return the session's current ETag and its built artifact, if there is one."""
+        with self._lock:
+            cached = self._artifacts.get((session_id, store_only))
+        if cached and cached[1].exists():
+            # Mark it recently used, so trimming deletes other artifacts first
+            os.utime(cached[1])
+            return cached
+        # The manifest index keeps a running content digest, so this does not touch the disk
+        etag = manifest_for(project_path).digest().replace("-", "")
+        if store_only:
+            # A different archive of the same files; it must not satisfy the other's If-None-Match
+            etag += "-stored"
+        path = self._artifact_path(session_id, etag)
+        if path.exists():
+            with self._lock:
+                self._artifacts[(session_id, store_only)] = (etag, path)
+            return etag, path
+        return etag, None
+
+    def build(self, session_id: str, project_path: pathlib.Path, etag: str, store_only: bool = False) -> Iterator[bytes]:
+        """Stream a freshly built ZIP while saving it as the session's artifact for later requests."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._artifact_path(session_id, etag)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        with self._lock:
+            generation = self._generations.get(session_id, 0)
+        completed = False
+        try:
+            with open(tmp_path, "wb") as out:
+                for chunk in iter_zip(project_path, store_only=store_only):
+                    out.write(chunk)
+                    yield chunk
+            with self._lock:
+                # Only keep it if no file changed while it was being built
+                if self._generations.get(session_id, 0) == generation:
+                    os.replace(tmp_path, path)
+                    self._artifacts[(session_id, store_only)] = (etag, path)
+                    completed = True
+                    self._trim(keep=path)
+        finally:
+            if not completed:
+                tmp_path.unlink(missing_ok=True)
@@ -0,0 +1,121 @@
+import json
+import pathlib
+import threading
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+
+# Every Nth sequence number remembers its byte offset in the spill file, so old reads can seek
+_SPILL_INDEX_EVERY = 256
+
+
+class EventLog:
+    """Bounded per-session event log with monotonically increasing sequence numbers.
+
+    The newest `maxlen` events are kept in a ring buffer. With `spill_path`, every event is also
+    appended to a JSON-lines file, so events that fell out of the ring can still be read.
+    """
+
+    def __init__(self, maxlen: int = 1000, spill_path: Optional[pathlib.Path] = None):
+        self._events: deque = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.last_seq = 0
+        self.spill_path = spill_path
+        self._spill_offsets: List[int] = []
+        self._spill_file = None
+        # Set by close(): the run is over and no more events will be appended
+        self.closed = False
+        if spill_path is not None:
+            spill_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def append(self, event: dict, on_append: Optional[Callable[[dict], None]] = None) -> dict:
+        """Assign the next sequence number, store the event and return it (with "seq" set).
+
+        `on_append` runs under the log's lock, so events it publishes leave in sequence order
+        even when several threads log at once.
+        """
+        with self._lock:
+            self.last_seq += 1
+            event = {"seq": self.last_seq, **event}
+            self._events.append(event)
+            if self.spill_path is not None:
+                if self._spill_file is None:
+                    # Opened on demand; close() releases the handle once a run is over
+                    self._spill_file = open(self.spill_path, "ab")
+                if (self.last_seq - 1) % _SPILL_INDEX_EVERY == 0:
+                    self._spill_offsets.append(self._spill_file.tell())
+                self._spill_file.write(json.dumps(event, default=str).encode("utf-8") + b"\n")
+                self._spill_file.flush()
+            if on_append is not None:
+                on_append(event)
+            return event
+
+    @property
+    def first_seq(self) -> int:
+        """Oldest sequence number still held in memory (last_seq + 1 when empty)."""
+        with self._lock:
+            return self._events[0]["seq"] if self._events else self.last_seq + 1
+
+    def read(self, since: Optional[int] = None, limit: int = 100) -> Tuple[List[dict], bool]:
+        """Events with seq > `since` (oldest first), at most `limit` of them, and whether more remain.
+
+        With `since` omitted, returns the newest `limit` events.
+        """
+        limit = max(0, limit)
+        with self._lock:
+            last_seq = self.last_seq
+            if since is None:
+                events = list(self._events)[-limit:] if limit else []
+                return events, False
+            first_in_memory = self._events[0]["seq"] if self._events else last_seq + 1
+            if since + 1 >= first_in_memory:
+                start = since + 1 - first_in_memory
+                events = [self._events[i] for i in range(start, min(len(self._events), start + limit))]
+                return events, since + len(events) < last_seq
+        events = self._read_spilled(since, limit)
+        return events, since + len(events) < last_seq
+
+    def _read_spilled(self, since: int, limit: int) -> List[dict]:
+        block = since // _SPILL_INDEX_EVERY
+        with self._lock:
+            spill_path = self.spill_path
+            offset = self._spill_offsets[block] if block < len(self._spill_offsets) else 0
+        events = []
+        try:
+            if spill_path is None:
+                raise FileNotFoundError
+            with open(spill_path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    event = json.loads(line)
+                    if event["seq"] <= since:
+                        continue
+                    events.append(event)
+                    if len(events) >= limit:
+                        break
+        except FileNotFoundError:
+            # Nothing older than the ring survives; start from the oldest event still held
+            return self.read(self.first_seq - 1, limit)[0]
+        return events
+
+    def discard_spill(self):
+        """Delete the spill file; from then on only the events in memory can be read."""
+        with self._lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+            if self.spill_path is not None:
+                self.spill_path.unlink(missing_ok=True)
+                self.spill_path = None
+                self._spill_offsets = []
+
+    def reopen(self):
+        """Take events again after close(), for a run that is resumed."""
+        with self._lock:
+            self.closed = False
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
@@ -0,0 +1,384 @@
+import asyncio
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+from fastapi import WebSocket
+
+try:
+    import msgpack
+except ImportError:  # optional; every client gets JSON frames without it
+    msgpack = None
+
+# What to do when a connection's send queue is full
+SLOW_CONSUMER_POLICIES = ("snapshot", "drop_oldest", "disconnect")
+
+
+
+class Frame:
+    """A queued message and its wire encodings, each computed at most once.
+
+    One frame is shared by every connection of a session, so a broadcast is serialized once
+    per encoding rather than once per connection.
+    """
+
+    __slots__ = ("message", "_encoded")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    def encode(self, encoding: str) -> Union[str, bytes]:
+        data = self._encoded.get(encoding)
+        if data is None:
+            if encoding == "msgpack":
+                data = msgpack.packb(self.message, default=str)
+            else:
+                data = json.dumps(self.message, default=str)
+            self._encoded[encoding] = data
+        return data
+
+
+# Queue marker: replace everything the connection missed with a fresh session snapshot
+_RESYNC = Frame({"type": "_resync"})
+
+# Events per log read while replaying to a reconnecting client
+REPLAY_PAGE_SIZE = 500
+
+
+class ConnectionManager:
+    """Fans session events out to WebSocket connections from any thread.
+
+    Everything that touches a WebSocket runs on the server's event loop. Agent worker threads
+    call `publish`, which hands the message to that loop with `call_soon_threadsafe`; each
+    connection has its own queue drained by a sender task, so no event loop is ever created
+    per event and a connection is only ever written to by its own task.
+
+    With a `batch_window` (seconds), events published within the window are coalesced into one
+    `{"type": "batch", "events": [...], "files": [...]}` frame: repeated `file` events for a
+    path collapse to the newest one and `files` carries the manifest entries of the paths
+    written (from `file_info`), so clients need no follow-up file listing.
+
+    Send queues hold at most `queue_size` frames, so a slow client cannot hold up the others
+    or grow memory without bound. When one fills up, `policy` decides: "snapshot" drops the
+    backlog and sends the client a fresh state snapshot (from `snapshot`) instead,
+    "drop_oldest" discards the oldest queued frame, and "disconnect" closes the connection
+    so the client reconnects and replays from its last seq.
+
+    Frames are JSON text unless the client offers the "msgpack" WebSocket subprotocol and
+    msgpack is installed, in which case they are binary msgpack.
+    """
+
+    def __init__(self, batch_window: float = 0.0,
+                 file_info: Optional[Callable[[str, List[str]], List[dict]]] = None,
+                 queue_size: int = 256, policy: str = "snapshot",
+                 snapshot: Optional[Callable[[str], dict]] = None,
+                 read_events: Optional[Callable[[str, int, int], Tuple[List[dict], bool]]] = None):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy {policy!r}, expected one of {SLOW_CONSUMER_POLICIES}")
+        if policy == "snapshot" and snapshot is None:
+            raise ValueError("The snapshot policy needs a snapshot callback")
+        self.active_connections: Dict[str, List[WebSocket]] = {}
+        self._queues: Dict[WebSocket, asyncio.Queue] = {}
+        self._encodings: Dict[WebSocket, str] = {}
+        self._senders: Dict[WebSocket, asyncio.Task] = {}
+        # Highest event seq each connection has been sent; older copies are skipped
+        self._sent_seq: Dict[WebSocket, int] = {}
+        # HTTP long-poll and SSE requests waiting for a session's next events
+        self._watchers: Dict[str, Set[asyncio.Event]] = {}
+        # Connections catching up from the event log; live frames skip them until they are done
+        self._replaying: Set[WebSocket] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batch_window = batch_window
+        self.file_info = file_info
+        # Events waiting for their session's next batch frame
+        self._pending: Dict[str, List[dict]] = {}
+        self._pending_lock = threading.Lock()
+        self.queue_size = queue_size
+        self.policy = policy
+        self.snapshot = snapshot
+        self.read_events = read_events
+        self.dropped_frames = 0
+        self.snapshots_sent = 0
+        self.slow_disconnects = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Bind the hub to the event loop that owns the WebSockets (called on startup)."""
+        self.loop = loop
+
+    async def connect(self, websocket: WebSocket, session_id: str):
+        offered = websocket.scope.get("subprotocols") or []
+        encoding = "msgpack" if "msgpack" in offered and msgpack is not None else "json"
+        await websocket.accept(subprotocol=encoding if encoding in offered else None)
+        self._encodings[websocket] = encoding
+        if self.loop is None:
+            self.bind_loop(asyncio.get_running_loop())
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._queues[websocket] = queue
+        self._senders[websocket] = asyncio.create_task(self._sender(websocket, session_id, queue))
+        if session_id not in self.active_connections:
+            self.active_connections[session_id] = []
+        self.active_connections[session_id].append(websocket)
+
+    def disconnect(self, websocket: WebSocket, session_id: str):
+        if session_id in self.active_connections:
+            if websocket in self.active_connections[session_id]:
+                self.active_connections[session_id].remove(websocket)
+            if not self.active_connections[session_id]:
+                del self.active_connections[session_id]
+        self._queues.pop(websocket, None)
+        self._encodings.pop(websocket, None)
+        self._sent_seq.pop(websocket, None)
+        self._replaying.discard(websocket)
+        sender = self._senders.pop(websocket, None)
+        if sender is not None and sender is not asyncio.current_task():
+            sender.cancel()
+
+    async def send_to_connection(self, websocket: WebSocket, message: dict):
+        """Queue a message for one connection, behind anything already queued for it.
+
+        Waits for room in the queue rather than applying the slow-consumer policy.
+        """
+        queue = self._queues.get(websocket)
+        if queue is not None:
+            await queue.put(Frame(message))
+
+    async def replay(self, websocket: WebSocket, since: int):
+        """Send a connection the logged events after `since`, after what is already queued for it.
+
+        The connection's sender reads them from the event log (via `read_events`) and live frames
+        are not queued for it meanwhile, so a long replay cannot overflow its send queue.
+        """
+        queue = self._queues.get(websocket)
+        if queue is not None:
+            self._replaying.add(websocket)
+            await queue.put(Frame({"type": "_replay", "since": since}))
+
+    def pause(self, websocket: WebSocket):
+        """Stop queueing live frames for a connection until `replay` (or `resume`) catches it up."""
+        if websocket in self._queues:
+            self._replaying.add(websocket)
+
+    def resume(self, websocket: WebSocket):
+        """Queue live frames for a paused connection again, without replaying what it missed."""
+        self._replaying.discard(websocket)
+
+    def skip_through(self, websocket: WebSocket, seq: int):
+        """Mark events up to `seq` as already delivered to a connection (e.g. inside a snapshot)."""
+        if websocket in self._queues:
+            self._sent_seq[websocket] = max(self._sent_seq.get(websocket, 0), seq)
+
+    def publish(self, session_id: str, message: dict):
+        """Thread-safe: deliver a message to a session's connections from any thread."""
+        if self.loop is None or self.loop.is_closed():
+            return
+        if self.batch_window <= 0:
+            self._call_in_loop(self._dispatch, session_id, message)
+            return
+        with self._pending_lock:
+            pending = self._pending.get(session_id)
+            if pending is not None:
+                pending.append(message)
+                return
+            self._pending[session_id] = [message]
+        # First event of a window: a single loop wake-up schedules the flush
+        self._call_in_loop(self._schedule_flush, session_id)
+
+    def _call_in_loop(self, callback: Callable, *args):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _schedule_flush(self, session_id: str):
+        self.loop.call_later(self.batch_window, self._flush, session_id)
+
+    def _flush(self, session_id: str):
+        with self._pending_lock:
+            events = self._pending.pop(session_id, [])
+        if events:
+            self._dispatch(session_id, self._build_frame(session_id, events))
+
+    def _build_frame(self, session_id: str, events: List[dict]) -> dict:
+        # Only the newest write of each path survives
+        last_write = {}
+        for idx, event in enumerate(events):
+            if event.get("type") == "file" and "path" in event:
+                last_write[event["path"]] = idx
+        merged = [event for idx, event in enumerate(events)
+                  if event.get("type") != "file" or last_write.get(event.get("path")) == idx]
+        frame = {"type": "batch", "events": merged}
+        if last_write and self.file_info is not None:
+            try:
+                frame["files"] = self.file_info(session_id, list(last_write))
+            except Exception as e:
+                print(f"Could not attach file info to batch: {e}")
+        return frame
+
+    async def wait(self, session_id: str, timeout: float) -> bool:
+        """Wait until the session publishes something (or `wake` is called); False on timeout."""
+        event = asyncio.Event()
+        watchers = self._watchers.setdefault(session_id, set())
+        watchers.add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            watchers.discard(event)
+            if not watchers and self._watchers.get(session_id) is watchers:
+                del self._watchers[session_id]
+
+    def watched_sessions(self) -> Dict[str, Optional[int]]:
+        """Sessions someone is following live, each with the lowest seq its WebSocket clients
+        have been sent (None when only HTTP readers are waiting)."""
+        watched: Dict[str, Optional[int]] = {session_id: None for session_id in self._watchers}
+        for session_id, connections in self.active_connections.items():
+            if connections:
+                watched[session_id] = min(self._sent_seq.get(ws, 0) for ws in connections)
+        return watched
+
+    def wake(self, session_id: str):
+        """Thread-safe: release everyone waiting on a session (e.g. when its run is over)."""
+        if self.loop is not None and not self.loop.is_closed():
+            self._call_in_loop(self._wake, session_id)
+
+    def _wake(self, session_id: str):
+        for event in self._watchers.get(session_id, ()):
+            event.set()
+
+    def _dispatch(self, session_id: str, message: dict):
+        self._wake(session_id)
+        # Copied: the disconnect policy removes connections while we iterate
+        last = message["events"][-1] if message.get("type") == "batch" else message
+        seq = last.get("seq")
+        frame = Frame(message)
+        for connection in list(self.active_connections.get(session_id, [])):
+            queue = self._queues.get(connection)
+            if queue is None or connection in self._replaying:
+                continue
+            if seq is not None and seq <= self._sent_seq.get(connection, 0):
+                # Already sent (replay or snapshot); don't let it take up queue space
+                continue
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._overflow(connection, session_id, queue, frame)
+
+    def _overflow(self, websocket: WebSocket, session_id: str, queue: asyncio.Queue, frame: Frame):
+        if self.policy == "drop_oldest":
+            queue.get_nowait()
+            self.dropped_frames += 1
+            queue.put_nowait(frame)
+        elif self.policy == "snapshot":
+            # The snapshot is taken when it is sent, so it covers this message too
+            while not queue.empty():
+                if queue.get_nowait() is not _RESYNC:
+                    self.dropped_frames += 1
+            self.dropped_frames += 1
+            queue.put_nowait(_RESYNC)
+        else:
+            self.dropped_frames += queue.qsize() + 1
+            self.slow_disconnects += 1
+            print(f"Disconnecting slow WebSocket client of session {session_id}")
+            self.disconnect(websocket, session_id)
+            # 1013: try again later
+            asyncio.ensure_future(self._close(websocket, 1013))
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._queues),
+            "queued_frames": sum(queue.qsize() for queue in self._queues.values()),
+            "queue_size": self.queue_size,
+            "policy": self.policy,
+            "batch_window_ms": round(self.batch_window * 1000),
+            "dropped_frames": self.dropped_frames,
+            "snapshots_sent": self.snapshots_sent,
+            "slow_disconnects": self.slow_disconnects,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+        }
+
+    def _unsent(self, websocket: WebSocket, message: dict) -> Optional[dict]:
+        """Drop events this connection already got (replayed and live copies), in seq order."""
+        sent = self._sent_seq.get(websocket, 0)
+        if message.get("type") == "batch":
+            events = [e for e in message["events"] if e.get("seq") is None or e["seq"] > sent]
+            if not events:
+                return None
+            seqs = [e["seq"] for e in events if e.get("seq") is not None]
+            if seqs:
+                self._sent_seq[websocket] = max(seqs)
+            return message if len(events) == len(message["events"]) else {**message, "events": events}
+        seq = message.get("seq")
+        if seq is not None:
+            if seq <= sent:
+                return None
+            self._sent_seq[websocket] = seq
+        return message
+
+    async def _send(self, websocket: WebSocket, frame: Frame):
+        data = frame.encode(self._encodings.get(websocket, "json"))
+        if isinstance(data, bytes):
+            await websocket.send_bytes(data)
+        else:
+            await websocket.send_text(data)
+        self.frames_sent += 1
+        self.bytes_sent += len(data)
+
+    async def _send_replay(self, websocket: WebSocket, session_id: str, since: int):
+        caught_up = False
+        while True:
+            # Log reads may block (SQLite store), so they run off the event loop
+            events, has_more = await asyncio.to_thread(self.read_events, session_id, since, REPLAY_PAGE_SIZE)
+            for event in events:
+                event = self._unsent(websocket, event)
+                if event is not None:
+                    await self._send(websocket, Frame(event))
+            if events:
+                since = events[-1]["seq"]
+            if has_more and events:
+                continue
+            if caught_up:
+                return
+            # Live frames are queued from here on; one more read picks up what was logged (and
+            # skipped live) while the last one ran, and `_unsent` drops the overlap
+            self._replaying.discard(websocket)
+            caught_up = True
+
+    async def _sender(self, websocket: WebSocket, session_id: str, queue: asyncio.Queue):
+        try:
+            while True:
+                frame = await queue.get()
+                if frame.message.get("type") == "_replay":
+                    await self._send_replay(websocket, session_id, frame.message["since"])
+                    continue
+                if frame is _RESYNC:
+                    frame = Frame(await asyncio.to_thread(self.snapshot, session_id))
+                    self._sent_seq[websocket] = max(self._sent_seq.get(websocket, 0), frame.message["seq"])
+                    self.snapshots_sent += 1
+                else:
+                    message = self._unsent(websocket, frame.message)
+                    if message is None:
+                        continue
+                    if message is not frame.message:
+                        frame = Frame(message)
+                await self._send(websocket, frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"WebSocket send error: {e}")
+            self.disconnect(websocket, session_id)
@@ -0,0 +1,167 @@
+import json
+import math
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from .jobs import QueueFullError
+from .session_store import write_transaction
+
+
+@dataclass
+class LeasedJob:
+    job_id: str
+    payload: dict
+    attempts: int
+    queued_at: float
+
+
+class SQLiteJobQueue:
+    """Durable job queue shared by the API and worker nodes through one SQLite file.
+
+    Workers `lease` a job for `lease_seconds` and keep it with `heartbeat`; a job whose lease
+    runs out (its worker died or hung) goes back to the queue for another worker, up to
+    `max_attempts` leases. Higher priority is leased first, FIFO within a priority.
+    """
+
+    def __init__(self, path: pathlib.Path, max_queue: int = 32, max_attempts: int = 3,
+                 journal_mode: str = "WAL"):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY, payload TEXT NOT NULL, priority INTEGER NOT NULL,"
+            " status TEXT NOT NULL, queued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+            " leased_by TEXT, lease_expires_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, priority DESC, queued_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (status, lease_expires_at)")
+
+    def _write(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return write_transaction(self._conn, self._lock, fn)
+
+    def enqueue(self, job_id: str, payload: dict, priority: int = 0) -> int:
+        """Queue a job and return its 1-based position; raises QueueFullError at capacity."""
+        def run(conn):
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queue:
+                raise QueueFullError(self.retry_after())
+            # A finished job may be queued again under its id (a resumed session)
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, payload, priority, status, queued_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, json.dumps(payload), priority, time.time()),
+            )
+        self._write(run)
+        return self.position(job_id)
+
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[LeasedJob]:
+        """Take the next job for `lease_seconds`, first returning expired leases to the queue."""
+        def run(conn):
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', leased_by = NULL, lease_expires_at = NULL"
+                " WHERE status = 'leased' AND lease_expires_at < ?", (now,)
+            )
+            row = conn.execute(
+                "SELECT job_id, payload, attempts, queued_at FROM jobs WHERE status = 'queued'"
+                " ORDER BY priority DESC, queued_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', leased_by = ?, lease_expires_at = ?, attempts = attempts + 1"
+                " WHERE job_id = ?", (worker_id, now + lease_seconds, row[0])
+            )
+            return LeasedJob(row[0], json.loads(row[1]), row[2] + 1, row[3])
+        return self._write(run)
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Extend a lease; False if the job is no longer leased to this worker."""
+        def run(conn):
+            return conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE job_id = ? AND leased_by = ? AND status = 'leased'",
+                (time.time() + lease_seconds, job_id, worker_id),
+            ).rowcount == 1
+        return self._write(run)
+
+    def complete(self, job_id: str, worker_id: str, ok: bool = True):
+        def run(conn):
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, lease_expires_at = NULL"
+                " WHERE job_id = ? AND leased_by = ? AND status = 'leased'",
+                ("done" if ok else "failed", time.time(), job_id, worker_id),
+            )
+        self._write(run)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a waiting job, or None if it is not queued."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT priority, queued_at FROM jobs WHERE job_id = ? AND status = 'queued'", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            ahead = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+                " AND (priority > ? OR (priority = ? AND queued_at < ?))", (row[0], row[0], row[1])
+            ).fetchone()[0]
+        return ahead + 1
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queue slot frees up, from recent run times and active workers."""
+        with self._lock:
+            recent = self._conn.execute(
+                "SELECT AVG(finished_at - queued_at) FROM (SELECT finished_at, queued_at FROM jobs"
+                " WHERE status = 'done' ORDER BY finished_at DESC LIMIT 20)"
+            ).fetchone()[0]
+            workers = self._conn.execute(
+                "SELECT COUNT(DISTINCT leased_by) FROM jobs WHERE status = 'leased'"
+            ).fetchone()[0]
+            queued = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        return max(1, math.ceil((recent or 60.0) * max(1, queued) / max(1, workers)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            workers = self._conn.execute(
+                "SELECT COUNT(DISTINCT leased_by) FROM jobs WHERE status = 'leased'"
+            ).fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "queued": counts.get("queued", 0),
+            "running": counts.get("leased", 0),
+            "completed": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "max_queue": self.max_queue,
+            "busy_workers": workers,
+        }
+
+
+def create_job_queue() -> Optional[SQLiteJobQueue]:
+    """The shared job queue configured from the environment, or None to run jobs in this process.
+
+    JOB_QUEUE=sqlite (at JOB_QUEUE_PATH, default .cache/jobs.sqlite) hands generations to worker
+    nodes (`python -m api.worker_node`). JOB_MAX_QUEUE caps waiting jobs, JOB_MAX_ATTEMPTS the
+    leases per job.
+    """
+    if os.getenv("JOB_QUEUE", "local").lower() != "sqlite":
+        return None
+    return SQLiteJobQueue(
+        pathlib.Path(os.getenv("JOB_QUEUE_PATH", ".cache/jobs.sqlite")),
+        max_queue=int(os.getenv("JOB_MAX_QUEUE", "32")),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+        journal_mode=os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    )
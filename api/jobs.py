@@ -0,0 +1,131 @@
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity; `retry_after` is a hint in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+@dataclass(order=True)
+class _Job:
+    sort_key: tuple
+    job_id: str = field(compare=False)
+    fn: Callable = field(compare=False)
+    args: tuple = field(compare=False)
+    queued_at: float = field(compare=False)
+
+
+class JobScheduler:
+    """Runs agent jobs on a fixed pool of worker threads fed by a bounded priority queue.
+
+    Higher priority runs first, FIFO within a priority. When `max_queue` jobs are already
+    waiting, `submit` raises QueueFullError instead of letting work pile up.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 32,
+                 on_start: Optional[Callable[[str, float], None]] = None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.on_start = on_start
+        self._heap: list[_Job] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers: list[threading.Thread] = []
+        self._running: Dict[str, float] = {}
+        self._stopping = False
+        self.completed = 0
+        self.rejected = 0
+        self._avg_run_seconds = 60.0
+        self._avg_wait_seconds = 0.0
+
+    def start(self):
+        with self._cond:
+            self._stopping = False
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, name=f"job-worker-{len(self._workers)}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+
+    def shutdown(self):
+        """Stop taking jobs; running jobs finish on their (daemon) threads."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._workers = []
+
+    def submit(self, job_id: str, fn: Callable, *args: Any, priority: int = 0) -> int:
+        """Queue `fn(*args)` and return its 1-based queue position."""
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(self.retry_after())
+            heapq.heappush(self._heap, _Job((-priority, next(self._seq)), job_id, fn, args, time.time()))
+            self._cond.notify()
+            return self._position(job_id)
+
+    def _position(self, job_id: str) -> Optional[int]:
+        for idx, job in enumerate(sorted(self._heap)):
+            if job.job_id == job_id:
+                return idx + 1
+        return None
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a waiting job, or None if it is not queued."""
+        with self._cond:
+            return self._position(job_id)
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queue slot frees up, for Retry-After headers."""
+        return max(1, math.ceil(self._avg_run_seconds * max(1, len(self._heap)) / max(1, self.max_workers)))
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "workers": self.max_workers,
+                "running": len(self._running),
+                "queued": len(self._heap),
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_seconds": round(self._avg_wait_seconds, 3),
+                "avg_run_seconds": round(self._avg_run_seconds, 3),
+            }
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._heap and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                job = heapq.heappop(self._heap)
+                started = time.time()
+                wait = started - job.queued_at
+                self._avg_wait_seconds = 0.8 * self._avg_wait_seconds + 0.2 * wait
+                self._running[job.job_id] = started
+            try:
+                if self.on_start:
+                    self.on_start(job.job_id, wait)
+                # Fresh context per job so no tool session leaks between jobs on a reused thread
+                contextvars.Context().run(job.fn, *job.args)
+            except Exception as e:
+                print(f"Job {job.job_id} failed: {e}")
+            finally:
+                with self._cond:
+                    self._running.pop(job.job_id, None)
+                    self.completed += 1
+                    self._avg_run_seconds = 0.8 * self._avg_run_seconds + 0.2 * (time.time() - started)
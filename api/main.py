@@ -1,22 +1,198 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException, WebSocket, WebSocketDisconnect
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi import Request, Response
 from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import uuid
 import asyncio
-from typing import Dict, Any, Optional, List
-import threading
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import json
 import os
 import pathlib
-import zipfile
-import io
+import socket
+
+from Agent.manifest import manifest_for
+
+from .job_queue import create_job_queue
+from .jobs import JobScheduler, QueueFullError
+from .runner import (
+    EVENT_PAGE_SIZE, JOB_MAX_WORKERS, RUN_OWNER, SHARED_STORE, file_record, get_session_project_path, manager,
+    record_event, run_agent_background, session_store, session_view, worker_pool, zip_artifacts,
+)
 
 load_dotenv()
 
-app = FastAPI(title="Code Builder API", version="0.1.0")
+
+def _on_job_start(session_id: str, wait_seconds: float):
+    session_store.update(session_id, wait_seconds=round(wait_seconds, 3))
+
+
+# Agent runs get their own bounded worker pool instead of the shared request threadpool
+scheduler = JobScheduler(
+    max_workers=JOB_MAX_WORKERS,
+    max_queue=int(os.getenv("JOB_MAX_QUEUE", "32")),
+    on_start=_on_job_start,
+)
+
+
+# JOB_QUEUE=sqlite hands generations to worker nodes through a shared queue instead
+job_queue = create_job_queue()
+if job_queue is not None and not SHARED_STORE:
+    raise RuntimeError("JOB_QUEUE=sqlite needs SESSION_STORE=sqlite so worker nodes can report back")
+
+# Worker nodes and other API processes log events to the shared store; this is how often we look for them
+REMOTE_EVENT_POLL_SECONDS = 0.25
+# Last logged seq of each session whose file events have been applied to this process's manifest
+_files_synced_seq: Dict[str, int] = {}
+
+
+def _remote_events(events: List[dict]) -> List[dict]:
+    """The events another process logged; ours were published and applied when we logged them."""
+    return [event for event in events if event.get("origin") != RUN_OWNER]
+
+
+def _apply_file_events(session_id: str, events: List[dict]):
+    """Bring this process's manifest and ZIP of a session up to date with logged file events.
+
+    Only the files the events name are re-read, except once the run is over: shell commands may
+    have changed files nobody logged, so the project is rescanned on next use.
+    """
+    paths = {event["path"] for event in events if event["type"] == "file"}
+    finished = any(
+        event["type"] == "error" or (event["type"] == "status" and event.get("status") in ("completed", "interrupted"))
+        for event in events
+    )
+    if not paths and not finished:
+        return
+    project_path = get_session_project_path(session_id)
+    manifest = manifest_for(project_path)
+    if finished:
+        manifest.mark_stale()
+    else:
+        for path in paths:
+            manifest.refresh(project_path / path)
+    zip_artifacts.invalidate(session_id)
+
+
+def sync_remote_files(session_id: str, project_path: pathlib.Path):
+    """Catch up on files other processes wrote while nobody here was relaying the session's events.
+
+    The relay only follows watched sessions, so file events can be missed; the ones logged since
+    the last sync are applied here. A session seen for the first time is rescanned once.
+    """
+    if not SHARED_STORE:
+        return
+    log = session_store.event_log(session_id)
+    synced = _files_synced_seq.get(session_id)
+    if synced is None:
+        _files_synced_seq[session_id] = log.last_seq
+        manifest_for(project_path).mark_stale()
+        zip_artifacts.invalidate(session_id)
+        return
+    while True:
+        events, has_more = log.read(synced, 500)
+        if not events:
+            return
+        _apply_file_events(session_id, _remote_events(events))
+        synced = _files_synced_seq[session_id] = events[-1]["seq"]
+        if not has_more:
+            return
+
+
+def _read_remote_events(session_id: str, since: Optional[int]) -> Tuple[List[dict], int, bool]:
+    """The events other processes logged in the next page after `since` (None: from now on), with
+    their file events applied; also returns the new cursor and whether the log is closed."""
+    log = session_store.event_log(session_id)
+    if since is None:
+        since = log.last_seq
+    events, _ = log.read(since, 500)
+    remote = _remote_events(events)
+    _apply_file_events(session_id, remote)
+    return remote, events[-1]["seq"] if events else since, log.closed
+
+
+async def relay_remote_events():
+    """Publish events logged by worker nodes and other API processes to this process's live readers.
+
+    Only sessions someone is following are polled. Log reads and file refreshes run in a
+    thread, off the event loop.
+    """
+    relayed: Dict[str, int] = {}
+    while True:
+        await asyncio.sleep(REMOTE_EVENT_POLL_SECONDS)
+        try:
+            watched = manager.watched_sessions()
+            for session_id in list(relayed):
+                if session_id not in watched:
+                    del relayed[session_id]
+            for session_id, sent_seq in watched.items():
+                since = relayed.get(session_id, sent_seq)
+                events, relayed[session_id], closed = await asyncio.to_thread(_read_remote_events, session_id, since)
+                for event in events:
+                    manager.publish(session_id, event)
+                if relayed[session_id] == since and closed:
+                    # Readers stop once the run is over and they have everything
+                    manager.wake(session_id)
+        except Exception as e:
+            print(f"Remote event relay error: {e}")
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        # Another host's process (or no owner recorded): not ours to judge
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def mark_interrupted_sessions():
+    """Mark sessions left queued or running by a dead API process on this host as interrupted.
+
+    Their runs can be continued from the last checkpoint with POST /api/sessions/{id}/resume.
+    """
+    for status in ("queued", "running"):
+        for session in session_store.list(status=status, limit=500):
+            session_id = session["session_id"]
+            if _owner_alive(session.get("owner")):
+                continue
+            session_store.update(session_id, status="interrupted", completed_at=datetime.now().isoformat())
+            record_event(session_id, {"type": "status", "status": "interrupted"})
+            session_store.event_log(session_id).close()
+            print(f"Session {session_id} was interrupted by a restart")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Events from agent threads are delivered on this loop
+    manager.bind_loop(asyncio.get_running_loop())
+    relay = None
+    if SHARED_STORE:
+        relay = asyncio.create_task(relay_remote_events())
+    if job_queue is None:
+        # Worker nodes hand abandoned jobs back through their leases; locally we do it here
+        mark_interrupted_sessions()
+        if worker_pool is not None:
+            worker_pool.start()
+        scheduler.start()
+    yield
+    if relay is not None:
+        relay.cancel()
+    scheduler.shutdown()
+    if worker_pool is not None:
+        worker_pool.shutdown()
+
+
+app = FastAPI(title="Code Builder API", version="0.1.0", lifespan=lifespan)
 
 # Add CORS middleware for frontend
 app.add_middleware(
@@ -27,225 +203,296 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory session storage (in production, use Redis or database)
-sessions: Dict[str, Dict[str, Any]] = {}
-
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, session_id: str):
-        await websocket.accept()
-        if session_id not in self.active_connections:
-            self.active_connections[session_id] = []
-        self.active_connections[session_id].append(websocket)
-
-    def disconnect(self, websocket: WebSocket, session_id: str):
-        if session_id in self.active_connections:
-            self.active_connections[session_id].remove(websocket)
-            if not self.active_connections[session_id]:
-                del self.active_connections[session_id]
-
-    async def send_to_session(self, session_id: str, message: dict):
-        if session_id in self.active_connections:
-            disconnected = []
-            for connection in self.active_connections[session_id]:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except:
-                    disconnected.append(connection)
-            
-            # Remove disconnected connections
-            for conn in disconnected:
-                self.active_connections[session_id].remove(conn)
-
-manager = ConnectionManager()
+# Idle SSE streams send a comment this often so proxies keep them open
+SSE_KEEPALIVE_SECONDS = 15
+
 
 class RunRequest(BaseModel):
     prompt: str
     model: Optional[str] = "llama-3.3-70b-versatile"
     temperature: Optional[float] = 0.0
+    priority: Optional[int] = 0
 
 class RunResponse(BaseModel):
     session_id: str
     status: str
     message: str
 
-def run_agent_background(session_id: str, prompt: str, model: str, temperature: float):
-    """Run the agent in a background thread."""
-    try:
-        # Import here to avoid circular imports
-        import sys
-        import os
-        # Add project root to Python path
-        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        if project_root not in sys.path:
-            sys.path.insert(0, project_root)
-        
-        from Agent.graph import create_session_agent
-        
-        # Create event emitter that updates session status and sends WebSocket messages
-        def session_emitter(sid: str, event: dict):
-            if sid in sessions:
-                # Add timestamp to event
-                event_with_timestamp = {
-                    "timestamp": datetime.now().isoformat(),
-                    **event
-                }
-                
-                # Store event in session
-                sessions[sid]["events"].append(event_with_timestamp)
-                
-                # Update session status based on event type
-                if event["type"] == "node":
-                    sessions[sid]["current_node"] = event["value"]
-                elif event["type"] == "file":
-                    if event["path"] not in sessions[sid]["files"]:
-                        sessions[sid]["files"].append(event["path"])
-                elif event["type"] == "done":
-                    sessions[sid]["status"] = "completed"
-                elif event["type"] == "error":
-                    sessions[sid]["status"] = "error"
-                    sessions[sid]["error"] = event.get("message", "Unknown error")
-                
-                # Send WebSocket message (run in async context)
-                try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(manager.send_to_session(sid, event_with_timestamp))
-                    loop.close()
-                except Exception as ws_error:
-                    print(f"WebSocket error: {ws_error}")
-        
-        # Create session-aware agent
-        agent = create_session_agent(session_id, session_emitter)
-        
-        # Update session status
-        sessions[session_id]["status"] = "running"
-        sessions[session_id]["started_at"] = datetime.now().isoformat()
-        
-        # Send initial status via WebSocket
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(manager.send_to_session(session_id, {
-                "type": "status",
-                "status": "running",
-                "timestamp": datetime.now().isoformat()
-            }))
-            loop.close()
-        except Exception as ws_error:
-            print(f"WebSocket error: {ws_error}")
-        
-        # Run the agent
-        result = agent.invoke(
-            {"user_prompt": prompt},
-            {"recursion_limit": 100}
-        )
-        
-        # Store final result
-        sessions[session_id]["result"] = result
-        sessions[session_id]["completed_at"] = datetime.now().isoformat()
-        
-        if sessions[session_id]["status"] != "error":
-            sessions[session_id]["status"] = "completed"
-            
-        # Send completion message via WebSocket
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(manager.send_to_session(session_id, {
-                "type": "status",
-                "status": "completed",
-                "timestamp": datetime.now().isoformat(),
-                "result": result
-            }))
-            loop.close()
-        except Exception as ws_error:
-            print(f"WebSocket error: {ws_error}")
-            
-    except Exception as e:
-        # Handle any errors
-        if session_id in sessions:
-            sessions[session_id]["status"] = "error"
-            sessions[session_id]["error"] = str(e)
-            sessions[session_id]["completed_at"] = datetime.now().isoformat()
-            
-            # Send error message via WebSocket
-            try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(manager.send_to_session(session_id, {
-                    "type": "error",
-                    "message": str(e),
-                    "timestamp": datetime.now().isoformat()
-                }))
-                loop.close()
-            except Exception as ws_error:
-                print(f"WebSocket error: {ws_error}")
-
 @app.get("/health")
 def health() -> dict:
     return {"status": "ok"}
 
+@app.get("/api/metrics")
+def get_metrics() -> dict:
+    """Cache and delivery counters for monitoring."""
+    from Agent.llm_cache import get_llm_cache
+    from Agent.plan_cache import get_plan_cache
+
+    llm_cache = get_llm_cache()
+    plan_cache = get_plan_cache()
+    return {
+        "llm_cache": llm_cache.stats() if llm_cache is not None and hasattr(llm_cache, "stats") else None,
+        "plan_cache": plan_cache.stats() if plan_cache is not None else None,
+        "jobs": job_queue.stats() if job_queue is not None else scheduler.stats(),
+        "websocket": manager.stats(),
+        "worker_processes": worker_pool.stats() if worker_pool is not None else None,
+    }
+
 @app.post("/api/run", response_model=RunResponse)
-async def run_project(request: RunRequest, background_tasks: BackgroundTasks):
+def run_project(request: RunRequest):
     """Start a new project generation session."""
     # Generate unique session ID
     session_id = str(uuid.uuid4())
     
     # Initialize session
-    sessions[session_id] = {
+    session_store.create({
         "session_id": session_id,
         "prompt": request.prompt,
         "model": request.model,
         "temperature": request.temperature,
-        "status": "starting",
+        "status": "queued",
         "created_at": datetime.now().isoformat(),
         "current_node": None,
         "files": [],
-        "events": [],
-        "result": None,
-        "error": None
-    }
+        "result_url": None,
+        "error": None,
+        "wait_seconds": None,
+        "owner": RUN_OWNER
+    })
     
-    # Start background task
-    background_tasks.add_task(
-        run_agent_background,
-        session_id,
-        request.prompt,
-        request.model,
-        request.temperature
-    )
+    # Queue the run; reject with 429 rather than letting work pile up
+    try:
+        if job_queue is not None:
+            position = job_queue.enqueue(
+                session_id,
+                {"prompt": request.prompt, "model": request.model, "temperature": request.temperature},
+                priority=request.priority or 0
+            )
+        else:
+            position = scheduler.submit(
+                session_id,
+                run_agent_background,
+                session_id,
+                request.prompt,
+                request.model,
+                request.temperature,
+                priority=request.priority or 0
+            )
+    except QueueFullError as e:
+        session_store.delete(session_id)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many queued generations, try again later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     
     return RunResponse(
         session_id=session_id,
-        status="starting",
-        message="Project generation started"
+        status="queued",
+        message=f"Project generation queued (position {position})"
+    )
+
+@app.post("/api/sessions/{session_id}/resume", response_model=RunResponse)
+def resume_session(session_id: str):
+    """Continue an interrupted or failed session from its last checkpoint.
+
+    Nodes and coder steps that finished are not run again. A session interrupted before its
+    run started has no checkpoint and is started from scratch.
+    """
+    from Agent.graph import can_resume
+
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if session["status"] in ("queued", "running"):
+        raise HTTPException(status_code=409, detail="Session is still running")
+    resumable = can_resume(session_id)
+    if not resumable and session["status"] != "interrupted":
+        raise HTTPException(status_code=409, detail="Session has no unfinished run to resume")
+
+    session_store.update(session_id, status="queued", error=None, completed_at=None, owner=RUN_OWNER)
+    session_store.event_log(session_id).reopen()
+    record_event(session_id, {"type": "status", "status": "queued", "resumed": resumable})
+    try:
+        if job_queue is not None:
+            position = job_queue.enqueue(
+                session_id,
+                {"prompt": session["prompt"], "model": session["model"],
+                 "temperature": session["temperature"], "resume": True}
+            )
+        else:
+            position = scheduler.submit(
+                session_id,
+                run_agent_background,
+                session_id,
+                session["prompt"],
+                session["model"],
+                session["temperature"],
+                True
+            )
+    except QueueFullError as e:
+        session_store.update(session_id, status=session["status"], error=session.get("error"),
+                             completed_at=session.get("completed_at"))
+        session_store.event_log(session_id).close()
+        raise HTTPException(
+            status_code=429,
+            detail="Too many queued generations, try again later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    return RunResponse(
+        session_id=session_id,
+        status="queued",
+        message=f"Project generation {'resumed' if resumable else 'restarted'} (position {position})"
     )
 
+@app.get("/api/sessions")
+def list_sessions(status: Optional[str] = None, limit: int = Query(50, ge=1, le=500),
+                   before: Optional[str] = None):
+    """List sessions newest first, optionally filtered by status.
+
+    Page with `before=<created_at of the last session seen>`.
+    """
+    return {"sessions": session_store.list(status=status, limit=limit, before=before)}
+
 @app.get("/api/sessions/{session_id}")
-async def get_session(session_id: str):
-    """Get session status and details."""
-    if session_id not in sessions:
+def get_session(session_id: str, since: Optional[int] = Query(None, ge=0),
+                limit: int = Query(EVENT_PAGE_SIZE, ge=0, le=1000)):
+    """Get session status and details.
+
+    `events` holds at most `limit` events: those after sequence number `since`, or the newest
+    ones when `since` is omitted. Poll with `since=<last_seq>` to fetch only new events.
+    """
+    if session_id not in session_store:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    session = session_view(session_id, since, limit)
+    if session["status"] == "queued":
+        queue = job_queue if job_queue is not None else scheduler
+        return {**session, "queue_position": queue.position(session_id), "queue_depth": queue.depth()}
+    return session
+
+@app.get("/api/sessions/{session_id}/result")
+def get_session_result(session_id: str):
+    """Full final graph state of a finished session (plan, task plan and coder state)."""
+    if session_id not in session_store:
+        raise HTTPException(status_code=404, detail="Session not found")
+    result = session_store.get_result(session_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Session has no result yet")
+    return result
+
+@app.get("/api/sessions/{session_id}/events")
+async def poll_events(session_id: str, since: int = Query(0, ge=0),
+                      limit: int = Query(EVENT_PAGE_SIZE, ge=1, le=1000),
+                      timeout: float = Query(25, ge=0, le=60)):
+    """Long-poll the session event log.
+
+    Returns the events after `since` as soon as there are any, or an empty page after `timeout`
+    seconds (immediately once the run is over). Poll again with `since=<last_seq>`.
+    """
+    # Store calls run in threads: a busy SQLite store must not hold up the event loop
+    if not await asyncio.to_thread(session_store.__contains__, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    log = await asyncio.to_thread(session_store.event_log, session_id)
+    
+    def read_page():
+        events, has_more = log.read(since, limit)
+        return events, has_more, log.closed
+    
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        events, has_more, closed = await asyncio.to_thread(read_page)
+        remaining = deadline - asyncio.get_running_loop().time()
+        if events or closed or remaining <= 0:
+            break
+        await manager.wait(session_id, remaining)
+    last_seq, status, closed = await asyncio.to_thread(
+        lambda: (log.last_seq, session_store.get(session_id)["status"], log.closed)
+    )
+    return {
+        "events": events,
+        "last_seq": last_seq,
+        "has_more": has_more,
+        "status": status,
+        "finished": closed
+    }
+
+@app.get("/api/sessions/{session_id}/stream")
+async def stream_events(session_id: str, request: Request, since: int = Query(0, ge=0)):
+    """Server-Sent Events stream of the session event log.
+
+    Each event goes out with its seq as the SSE id, so a reconnecting EventSource resumes after
+    the last one it got (Last-Event-ID takes precedence over `since`). The stream ends when the
+    run is over and every event has been sent.
+    """
+    if not await asyncio.to_thread(session_store.__contains__, session_id):
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return sessions[session_id]
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    log = await asyncio.to_thread(session_store.event_log, session_id)
+    
+    def read_page(cursor: int):
+        events, has_more = log.read(cursor, 500)
+        return events, has_more, log.closed and (events[-1]["seq"] if events else cursor) >= log.last_seq
+    
+    async def event_stream():
+        cursor = since
+        while True:
+            events, has_more, finished = await asyncio.to_thread(read_page, cursor)
+            if events:
+                yield "".join(f"id: {event['seq']}\ndata: {json.dumps(event, default=str)}\n\n" for event in events)
+                cursor = events[-1]["seq"]
+                if has_more:
+                    continue
+            if finished:
+                break
+            if await request.is_disconnected():
+                break
+            if not await manager.wait(session_id, SSE_KEEPALIVE_SECONDS):
+                yield ": keep-alive\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.websocket("/ws/progress/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: str):
-    """WebSocket endpoint for real-time progress updates."""
+async def websocket_endpoint(websocket: WebSocket, session_id: str, last_seq: Optional[int] = None):
+    """WebSocket endpoint for real-time progress updates.
+
+    A reconnecting client passes `last_seq` (the seq of the last event it saw) and gets only the
+    events it missed, replayed from the session event log, before live delivery resumes.
+    """
     await manager.connect(websocket, session_id)
+    # Live frames wait until the snapshot below is queued; it is read in a thread, so events
+    # can be published meanwhile
+    manager.pause(websocket)
     
     try:
         # Send initial session data if available
-        if session_id in sessions:
-            await websocket.send_text(json.dumps({
+        if await asyncio.to_thread(session_store.__contains__, session_id):
+            snapshot = await asyncio.to_thread(
+                session_view, session_id, limit=0 if last_seq is not None else EVENT_PAGE_SIZE
+            )
+            await manager.send_to_connection(websocket, {
                 "type": "session_data",
-                "data": sessions[session_id],
+                "data": snapshot,
                 "timestamp": datetime.now().isoformat()
-            }))
+            })
+            if last_seq is None:
+                # The snapshot already holds everything logged so far
+                manager.skip_through(websocket, snapshot["last_seq"])
+                last_seq = snapshot["last_seq"]
+            # Missed events are read from the log by the connection's sender; live
+            # delivery resumes once it has caught up
+            await manager.replay(websocket, last_seq)
+        else:
+            manager.resume(websocket)
         
         # Keep connection alive and handle any incoming messages
         while True:
@@ -253,11 +500,11 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                 # Wait for messages from client (ping/pong, etc.)
                 data = await websocket.receive_text()
                 # Echo back or handle client messages if needed
-                await websocket.send_text(json.dumps({
+                await manager.send_to_connection(websocket, {
                     "type": "pong",
                     "message": data,
                     "timestamp": datetime.now().isoformat()
-                }))
+                })
             except WebSocketDisconnect:
                 break
             except Exception as e:
@@ -265,19 +512,17 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                 break
                 
     except WebSocketDisconnect:
-        manager.disconnect(websocket, session_id)
+        pass
     except Exception as e:
         print(f"WebSocket connection error: {e}")
+    finally:
+        # Also stops this connection's sender task
         manager.disconnect(websocket, session_id)
 
-def get_session_project_path(session_id: str) -> pathlib.Path:
-    """Get the project path for a specific session."""
-    return pathlib.Path.cwd() / "generated_project" / session_id
-
 @app.get("/api/files")
-async def list_files(session_id: str):
+def list_files(session_id: str):
     """List all files in the session's project directory."""
-    if session_id not in sessions:
+    if session_id not in session_store:
         raise HTTPException(status_code=404, detail="Session not found")
     
     project_path = get_session_project_path(session_id)
@@ -285,27 +530,19 @@ async def list_files(session_id: str):
     if not project_path.exists():
         return {"files": [], "message": "Project directory not found"}
     
-    files = []
+    sync_remote_files(session_id, project_path)
     try:
-        for file_path in project_path.rglob("*"):
-            if file_path.is_file():
-                relative_path = file_path.relative_to(project_path)
-                file_size = file_path.stat().st_size
-                files.append({
-                    "name": str(relative_path),
-                    "path": str(relative_path),
-                    "size": file_size,
-                    "modified": datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
-                })
+        # Served from the in-memory manifest; no directory walk or stat calls per request
+        files = [file_record(entry) for entry in manifest_for(project_path).entries()]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing files: {str(e)}")
     
     return {"files": files, "session_id": session_id}
 
 @app.get("/api/file")
-async def get_file_content(session_id: str, path: str):
+def get_file_content(session_id: str, path: str):
     """Get the content of a specific file."""
-    if session_id not in sessions:
+    if session_id not in session_store:
         raise HTTPException(status_code=404, detail="Session not found")
     
     project_path = get_session_project_path(session_id)
@@ -354,9 +591,9 @@ async def get_file_content(session_id: str, path: str):
         raise HTTPException(status_code=500, detail=f"Error reading file: {str(e)}")
 
 @app.post("/api/file")
-async def update_file_content(session_id: str, path: str, content: str):
+def update_file_content(session_id: str, path: str, content: str):
     """Update the content of a specific file."""
-    if session_id not in sessions:
+    if session_id not in session_store:
         raise HTTPException(status_code=404, detail="Session not found")
     
     project_path = get_session_project_path(session_id)
@@ -378,6 +615,11 @@ async def update_file_content(session_id: str, path: str, content: str):
         # Write content to file
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(content)
+        manifest_for(get_session_project_path(session_id)).record_write(file_path, content)
+        zip_artifacts.invalidate(session_id)
+        if SHARED_STORE:
+            # Other API processes serving this session refresh the file from the event
+            record_event(session_id, {"type": "file", "path": path, "action": "write", "size": len(content)})
         
         return {
             "path": path,
@@ -389,9 +631,13 @@ async def update_file_content(session_id: str, path: str, content: str):
         raise HTTPException(status_code=500, detail=f"Error writing file: {str(e)}")
 
 @app.get("/api/zip")
-async def download_project_zip(session_id: str):
-    """Download the entire project as a ZIP file."""
-    if session_id not in sessions:
+def download_project_zip(session_id: str, request: Request, store_only: bool = False):
+    """Download the entire project as a ZIP file.
+
+    The first download streams the archive as it is compressed and keeps it; repeat downloads get
+    `304 Not Modified` (matching If-None-Match) or the kept file via sendfile until a file changes.
+    """
+    if session_id not in session_store:
         raise HTTPException(status_code=404, detail="Session not found")
     
     project_path = get_session_project_path(session_id)
@@ -399,49 +645,32 @@ async def download_project_zip(session_id: str):
     if not project_path.exists():
         raise HTTPException(status_code=404, detail="Project directory not found")
     
-    # Create ZIP file in memory
-    zip_buffer = io.BytesIO()
+    # Get session info for filename
+    session_info = session_store.get(session_id)
+    project_name = session_info.get("prompt", "project")[:50]  # Limit length
+    # Clean filename (remove special characters)
+    clean_name = "".join(c for c in project_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    if not clean_name:
+        clean_name = "generated_project"
     
-    try:
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Add all files from the project directory
-            for file_path in project_path.rglob("*"):
-                if file_path.is_file():
-                    # Get relative path for the ZIP
-                    relative_path = file_path.relative_to(project_path)
-                    
-                    # Read file content and add to ZIP
-                    with open(file_path, 'rb') as f:
-                        file_content = f.read()
-                    
-                    zip_file.writestr(str(relative_path), file_content)
-        
-        # Reset buffer position to beginning
-        zip_buffer.seek(0)
-        
-        # Get session info for filename
-        session_info = sessions[session_id]
-        project_name = session_info.get("prompt", "project")[:50]  # Limit length
-        # Clean filename (remove special characters)
-        clean_name = "".join(c for c in project_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        if not clean_name:
-            clean_name = "generated_project"
-        
-        filename = f"{clean_name}_{session_id[:8]}.zip"
-        
-        # Return ZIP file as streaming response
-        return StreamingResponse(
-            io.BytesIO(zip_buffer.getvalue()),
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "Content-Type": "application/zip"
-            }
-        )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error creating ZIP file: {str(e)}")
-    finally:
-        zip_buffer.close()
-
-
+    filename = f"{clean_name}_{session_id[:8]}.zip"
+    
+    sync_remote_files(session_id, project_path)
+    etag, artifact_path = zip_artifacts.lookup(session_id, project_path, store_only)
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "ETag": f'"{etag}"',
+        "Cache-Control": "no-cache"
+    }
+    if request.headers.get("if-none-match") in (etag, f'"{etag}"', f'W/"{etag}"'):
+        return Response(status_code=304, headers=headers)
+    
+    if artifact_path is not None:
+        return FileResponse(artifact_path, media_type="application/zip", headers=headers)
+    
+    # A sync generator: Starlette iterates it in the threadpool, so compression stays off the event loop
+    return StreamingResponse(
+        zip_artifacts.build(session_id, project_path, etag, store_only),
+        media_type="application/zip",
+        headers=headers
+    )
@@ -0,0 +1,253 @@
+"""Agent runs and the state they share with the API: session store, live event hub and ZIP cache.
+
+Imported by the API (api.main) and by worker nodes (api.worker_node); building it does not
+build the FastAPI app.
+"""
+import os
+import pathlib
+import socket
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from Agent.manifest import ManifestEntry, manifest_for
+
+from .archive import ZipArtifactCache
+from .events import ConnectionManager
+from .session_store import SQLiteSessionStore, create_session_store
+from .workers import AgentProcessPool, RunCancelled
+
+load_dotenv()
+
+# Generations run at the same time (API scheduler threads, or worker processes below)
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "2"))
+
+
+def file_record(entry) -> dict:
+    """API representation of a manifest entry (as listed by /api/files)."""
+    return {
+        "name": entry.path,
+        "path": entry.path,
+        "size": entry.size,
+        "modified": datetime.fromtimestamp(entry.mtime).isoformat()
+    }
+
+
+def _file_delta(session_id: str, paths: List[str]) -> List[dict]:
+    """Listing entries of files named in a batch frame.
+
+    Runs on the event loop, so it only looks in the manifest index, never rebuilding it; a file
+    the index does not know (yet) is stat'ed on its own.
+    """
+    project_path = get_session_project_path(session_id)
+    manifest = manifest_for(project_path)
+    records = []
+    for path in paths:
+        path = manifest.relative_path(path)
+        entry = manifest.peek(path)
+        if entry is None:
+            try:
+                stat = (project_path / path).stat()
+            except OSError:
+                # Deleted since
+                continue
+            entry = ManifestEntry(path, stat.st_size, stat.st_mtime, sha256="")
+        records.append(file_record(entry))
+    return records
+
+
+def _resync_snapshot(session_id: str) -> dict:
+    """Fresh session state for a client whose send queue overflowed; `seq` is where it resumes."""
+    snapshot = session_view(session_id)
+    return {
+        "type": "session_data",
+        "data": snapshot,
+        "seq": snapshot["last_seq"],
+        "resync": True,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+# WebSocket connection manager; agent threads publish events through it, coalesced into
+# one frame per EVENT_BATCH_MS window (0 sends every event on its own). Each connection
+# queues at most EVENT_SEND_QUEUE frames; EVENT_SLOW_CONSUMER picks what happens beyond that.
+manager = ConnectionManager(
+    batch_window=float(os.getenv("EVENT_BATCH_MS", "50")) / 1000,
+    file_info=_file_delta,
+    queue_size=int(os.getenv("EVENT_SEND_QUEUE", "256")),
+    policy=os.getenv("EVENT_SLOW_CONSUMER", "snapshot"),
+    snapshot=_resync_snapshot,
+    read_events=lambda session_id, since, limit: session_store.event_log(session_id).read(since, limit),
+)
+
+# Last built ZIP per session, reused until one of its files changes
+zip_artifacts = ZipArtifactCache(
+    pathlib.Path.cwd() / ".cache" / "zip_artifacts",
+    max_bytes=int(os.getenv("ZIP_ARTIFACT_MAX_MB", "512")) * 1024 * 1024
+)
+
+# AGENT_EXECUTION=process runs each generation in a pre-warmed worker process instead of a
+# thread of this one; the run hands its job over and relays its events
+worker_pool = AgentProcessPool(JOB_MAX_WORKERS) if os.getenv("AGENT_EXECUTION", "thread") == "process" else None
+
+
+# Session metadata, event logs and results; in memory by default, SQLite with SESSION_STORE=sqlite
+session_store = create_session_store()
+# A SQLite store can be shared with worker nodes and other API processes, which log events too
+SHARED_STORE = isinstance(session_store, SQLiteSessionStore)
+
+# This process, as recorded on the sessions it runs and (with a shared store) the events it logs
+RUN_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+# Events returned per page when a client does not ask for a limit
+EVENT_PAGE_SIZE = 100
+
+
+def get_session_project_path(session_id: str) -> pathlib.Path:
+    """Get the project path for a specific session."""
+    return pathlib.Path.cwd() / "generated_project" / session_id
+
+
+def record_event(session_id: str, event: dict) -> dict:
+    """Append an event to the session log and publish it to live connections.
+
+    In a shared store the event carries its `origin`, so other processes know to relay it.
+    """
+    origin = {"origin": RUN_OWNER} if SHARED_STORE else {}
+    return session_store.event_log(session_id).append(
+        {"timestamp": datetime.now().isoformat(), **event, **origin},
+        on_append=lambda logged: manager.publish(session_id, logged)
+    )
+
+
+def session_view(session_id: str, since: Optional[int] = None, limit: int = EVENT_PAGE_SIZE) -> dict:
+    """Session record with one page of its event log instead of the whole history.
+
+    The final graph state is large, so it only carries `result_url`, where it can be fetched.
+    """
+    log = session_store.event_log(session_id)
+    events, has_more = log.read(since, limit)
+    return {**session_store.get(session_id), "events": events, "last_seq": log.last_seq, "has_more": has_more}
+
+
+def result_url(session_id: str) -> str:
+    return f"/api/sessions/{session_id}/result"
+
+
+def result_summary(session_id: str, result: Optional[dict]) -> dict:
+    """The few facts about a finished run that clients show without loading the full result."""
+    result = result or {}
+    plan = result.get("plan") or {}
+    steps = (result.get("task_plan") or {}).get("implementation_steps") or []
+    return {
+        "name": plan.get("name"),
+        "description": plan.get("description"),
+        "tech_stack": plan.get("tech_stack"),
+        "steps": len(steps),
+        "steps_completed": len(result.get("completed_steps") or []),
+        "files": len(session_store.get(session_id)["files"]),
+    }
+
+
+def run_agent_background(session_id: str, prompt: str, model: str, temperature: float, resume: bool = False,
+                         cancel: Optional[threading.Event] = None):
+    """Run the agent in a background thread; with `resume`, continue from its last checkpoint.
+
+    Once `cancel` is set (the run's job now belongs to someone else) the run stops at its next
+    event and leaves the session, its log and its checkpoints alone.
+    """
+    try:
+        # Import here to avoid circular imports
+        import sys
+        import os
+        # Add project root to Python path
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if project_root not in sys.path:
+            sys.path.insert(0, project_root)
+        
+        project_path = get_session_project_path(session_id)
+        
+        # Create event emitter that updates session status and sends WebSocket messages
+        def session_emitter(sid: str, event: dict):
+            if cancel is not None and cancel.is_set():
+                raise RunCancelled(sid)
+            if sid in session_store:
+                # Update session status based on event type
+                if event["type"] == "node":
+                    session_store.update(sid, current_node=event["value"])
+                elif event["type"] == "file":
+                    zip_artifacts.invalidate(sid)
+                    if worker_pool is not None:
+                        # Written by the worker process; bring this process's index up to date
+                        manifest_for(project_path).refresh(project_path / event["path"])
+                    session_store.add_file(sid, event["path"])
+                elif event["type"] == "done":
+                    session_store.update(sid, status="completed")
+                elif event["type"] == "error":
+                    session_store.update(sid, status="error", error=event.get("message", "Unknown error"))
+                
+                # Log the event and hand the WebSocket message to the server loop
+                record_event(sid, event)
+        
+        if worker_pool is None:
+            from Agent.graph import can_resume, create_session_agent, forget_session, session_config
+            
+            # Create session-aware agent
+            agent = create_session_agent(session_id, session_emitter)
+        
+        # Update session status
+        session_store.update(session_id, status="running", started_at=datetime.now().isoformat())
+        
+        # Send initial status via WebSocket
+        record_event(session_id, {"type": "status", "status": "running", **({"resumed": True} if resume else {})})
+        
+        # Run the agent
+        if worker_pool is not None:
+            try:
+                result = worker_pool.run(session_id, prompt, session_emitter, resume=resume, cancel=cancel)
+            finally:
+                # Shell commands in the worker may have changed files we were not told about
+                manifest_for(project_path).mark_stale()
+                zip_artifacts.invalidate(session_id)
+        else:
+            # Checkpointed after every node; resuming passes no input and continues from the last one
+            resume = resume and can_resume(session_id)
+            result = agent.invoke(
+                None if resume else {"user_prompt": prompt},
+                session_config(session_id)
+            )
+            if cancel is not None and cancel.is_set():
+                raise RunCancelled(session_id)
+            forget_session(session_id)
+        
+        # Store final result
+        session_store.set_result(session_id, result)
+        finished = {"completed_at": datetime.now().isoformat(), "result_url": result_url(session_id)}
+        if session_store.get(session_id)["status"] != "error":
+            finished["status"] = "completed"
+        session_store.update(session_id, **finished)
+            
+        # Completion message carries a summary; the full result is fetched from result_url
+        record_event(session_id, {
+            "type": "status",
+            "status": "completed",
+            "summary": result_summary(session_id, result),
+            "result_url": result_url(session_id)
+        })
+            
+    except RunCancelled:
+        print(f"Run of session {session_id} cancelled; leaving the session to its new owner")
+    except Exception as e:
+        # Handle any errors
+        if session_id in session_store:
+            session_store.update(session_id, status="error", error=str(e), completed_at=datetime.now().isoformat())
+            
+            # Send error message via WebSocket
+            record_event(session_id, {"type": "error", "message": str(e)})
+    finally:
+        # Mark the log finished and release its spill file; wakes up SSE and long-poll readers
+        if session_id in session_store and not (cancel is not None and cancel.is_set()):
+            session_store.event_log(session_id).close()
+        manager.wake(session_id)
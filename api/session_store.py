@@ -0,0 +1,363 @@
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .event_log import EventLog
+
+
+def write_transaction(conn: sqlite3.Connection, lock: threading.RLock,
+                      fn: Callable[[sqlite3.Connection], Any]) -> Any:
+    """Run `fn` in one write transaction on an autocommit connection guarded by `lock`.
+
+    BEGIN IMMEDIATE takes the database write lock up front, so a read-then-write in `fn` cannot
+    be raced by another process sharing the file.
+    """
+    with lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            out = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return out
+
+
+class SessionStore(ABC):
+    """Where sessions live: their metadata, event log and final result.
+
+    Metadata is a flat JSON-able dict (status, created_at, files, ...). The final graph state is
+    kept apart from it, since it is large and only fetched on request.
+    """
+
+    @abstractmethod
+    def create(self, session: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[dict]:
+        """A copy of the session's metadata, or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, session_id: str, **fields: Any):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_file(self, session_id: str, path: str):
+        """Record a generated file path (once)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list(self, status: Optional[str] = None, limit: int = 50, before: Optional[str] = None) -> List[dict]:
+        """Sessions newest first, optionally with one status and created before `before`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_result(self, session_id: str, result: Any):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_result(self, session_id: str) -> Any:
+        raise NotImplementedError
+
+    @abstractmethod
+    def event_log(self, session_id: str):
+        """The session's event log (see EventLog for the interface)."""
+        raise NotImplementedError
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store; state is lost on restart. Event logs may spill to JSON-lines files.
+
+    At most `event_log_keep` spill files are kept; beyond that, those of the oldest finished
+    sessions are deleted, and so is a session's file when the session is deleted.
+    """
+
+    def __init__(self, event_log_size: int = 1000, event_log_dir: Optional[pathlib.Path] = None,
+                 event_log_keep: int = 100):
+        self.event_log_size = event_log_size
+        self.event_log_dir = event_log_dir
+        self.event_log_keep = event_log_keep
+        self._sessions: Dict[str, dict] = {}
+        self._results: Dict[str, Any] = {}
+        self._logs: Dict[str, EventLog] = {}
+        self._lock = threading.Lock()
+
+    def create(self, session: dict):
+        with self._lock:
+            self._sessions[session["session_id"]] = {**session, "files": list(session.get("files", []))}
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return {**session, "files": list(session["files"])} if session is not None else None
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def update(self, session_id: str, **fields: Any):
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions[session_id].update(fields)
+
+    def add_file(self, session_id: str, path: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and path not in session["files"]:
+                session["files"].append(path)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._results.pop(session_id, None)
+            log = self._logs.pop(session_id, None)
+        if log is not None:
+            log.close()
+            log.discard_spill()
+
+    def list(self, status: Optional[str] = None, limit: int = 50, before: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            matches = [
+                {**s, "files": list(s["files"])} for s in self._sessions.values()
+                if (status is None or s["status"] == status) and (before is None or s["created_at"] < before)
+            ]
+        matches.sort(key=lambda s: s["created_at"], reverse=True)
+        return matches[:limit]
+
+    def set_result(self, session_id: str, result: Any):
+        with self._lock:
+            self._results[session_id] = result
+
+    def get_result(self, session_id: str) -> Any:
+        with self._lock:
+            return self._results.get(session_id)
+
+    def event_log(self, session_id: str) -> EventLog:
+        with self._lock:
+            log = self._logs.get(session_id)
+            if log is None:
+                spill_path = self.event_log_dir / f"{session_id}.jsonl" if self.event_log_dir else None
+                log = self._logs[session_id] = EventLog(maxlen=self.event_log_size, spill_path=spill_path)
+                if spill_path is not None:
+                    self._trim_spills()
+            return log
+
+    def _trim_spills(self):
+        """Delete the spill files of the oldest finished sessions beyond `event_log_keep`."""
+        spilling = [log for log in self._logs.values() if log.spill_path is not None]
+        excess = len(spilling) - self.event_log_keep
+        for log in spilling:
+            if excess <= 0:
+                break
+            if log.closed:
+                log.discard_spill()
+                excess -= 1
+
+
+class SQLiteSessionStore(SessionStore):
+    """Durable store in one SQLite database (WAL mode by default), shareable by several processes.
+
+    Sessions are indexed by status and creation time; events are keyed by (session, seq).
+    WAL needs shared memory between the processes, so use journal_mode="DELETE" when the
+    file is on a network share used by several hosts.
+    """
+
+    def __init__(self, path: pathlib.Path, journal_mode: str = "WAL"):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        # Autocommit; writes that read first take the write lock with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at TEXT NOT NULL,"
+            " data TEXT NOT NULL, result TEXT, log_closed INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_status_created ON sessions (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_created ON sessions (created_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " session_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL,"
+            " PRIMARY KEY (session_id, seq)) WITHOUT ROWID"
+        )
+
+    def _write(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run `fn` in one write transaction."""
+        return write_transaction(self._conn, self._lock, fn)
+
+    def create(self, session: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, status, created_at, data) VALUES (?, ?, ?, ?)",
+                (session["session_id"], session["status"], session["created_at"], json.dumps(session, default=str)),
+            )
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+    def _modify(self, session_id: str, change: Callable[[dict], None]):
+        def run(conn):
+            row = conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return
+            session = json.loads(row[0])
+            change(session)
+            conn.execute(
+                "UPDATE sessions SET data = ?, status = ? WHERE session_id = ?",
+                (json.dumps(session, default=str), session["status"], session_id),
+            )
+        self._write(run)
+
+    def update(self, session_id: str, **fields: Any):
+        self._modify(session_id, lambda session: session.update(fields))
+
+    def add_file(self, session_id: str, path: str):
+        def change(session):
+            if path not in session["files"]:
+                session["files"].append(path)
+        self._modify(session_id, change)
+
+    def delete(self, session_id: str):
+        def run(conn):
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM events WHERE session_id = ?", (session_id,))
+        self._write(run)
+
+    def list(self, status: Optional[str] = None, limit: int = 50, before: Optional[str] = None) -> List[dict]:
+        query, params = "SELECT data FROM sessions", []
+        conditions = []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if before is not None:
+            conditions.append("created_at < ?")
+            params.append(before)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def set_result(self, session_id: str, result: Any):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET result = ? WHERE session_id = ?", (json.dumps(result, default=str), session_id)
+            )
+
+    def get_result(self, session_id: str) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def event_log(self, session_id: str) -> "SQLiteEventLog":
+        return SQLiteEventLog(self, session_id)
+
+
+class SQLiteEventLog:
+    """EventLog interface over the `events` table; seqs are assigned in the write transaction,
+    so several processes can log to the same session safely."""
+
+    def __init__(self, store: SQLiteSessionStore, session_id: str):
+        self.store = store
+        self.session_id = session_id
+
+    @property
+    def last_seq(self) -> int:
+        with self.store._lock:
+            row = self.store._conn.execute(
+                "SELECT MAX(seq) FROM events WHERE session_id = ?", (self.session_id,)
+            ).fetchone()
+        return row[0] or 0
+
+    @property
+    def closed(self) -> bool:
+        with self.store._lock:
+            row = self.store._conn.execute(
+                "SELECT log_closed FROM sessions WHERE session_id = ?", (self.session_id,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def append(self, event: dict, on_append: Optional[Callable[[dict], None]] = None) -> dict:
+        def run(conn):
+            row = conn.execute("SELECT MAX(seq) FROM events WHERE session_id = ?", (self.session_id,)).fetchone()
+            logged = {"seq": (row[0] or 0) + 1, **event}
+            conn.execute(
+                "INSERT INTO events (session_id, seq, data) VALUES (?, ?, ?)",
+                (self.session_id, logged["seq"], json.dumps(logged, default=str)),
+            )
+            return logged
+        with self.store._lock:
+            logged = self.store._write(run)
+            # Still under the lock, so publishes leave in seq order (as with EventLog)
+            if on_append is not None:
+                on_append(logged)
+        return logged
+
+    def read(self, since: Optional[int] = None, limit: int = 100) -> Tuple[List[dict], bool]:
+        limit = max(0, limit)
+        with self.store._lock:
+            if since is None:
+                rows = self.store._conn.execute(
+                    "SELECT data FROM events WHERE session_id = ? ORDER BY seq DESC LIMIT ?", (self.session_id, limit)
+                ).fetchall()
+                return [json.loads(row[0]) for row in reversed(rows)], False
+            rows = self.store._conn.execute(
+                "SELECT data FROM events WHERE session_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (self.session_id, since, limit),
+            ).fetchall()
+            events = [json.loads(row[0]) for row in rows]
+            return events, since + len(events) < self.last_seq
+
+    def reopen(self):
+        with self.store._lock:
+            self.store._conn.execute("UPDATE sessions SET log_closed = 0 WHERE session_id = ?", (self.session_id,))
+
+    def close(self):
+        with self.store._lock:
+            self.store._conn.execute("UPDATE sessions SET log_closed = 1 WHERE session_id = ?", (self.session_id,))
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store configured from the environment.
+
+    SESSION_STORE is "memory" (default) or "sqlite" (at SESSION_DB_PATH, default
+    .cache/sessions.sqlite, journal mode SQLITE_JOURNAL_MODE, default WAL). The memory store keeps EVENT_LOG_SIZE events per session in memory
+    and, if EVENT_LOG_DIR is set, spills them to files there, keeping those of the last
+    EVENT_LOG_KEEP sessions (default 100).
+    """
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            pathlib.Path(os.getenv("SESSION_DB_PATH", ".cache/sessions.sqlite")),
+            journal_mode=os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        )
+    if backend != "memory":
+        raise ValueError(f"Unknown SESSION_STORE {backend!r}, expected 'memory' or 'sqlite'")
+    event_log_dir = os.getenv("EVENT_LOG_DIR", "off")
+    return MemorySessionStore(
+        event_log_size=int(os.getenv("EVENT_LOG_SIZE", "1000")),
+        event_log_dir=pathlib.Path(event_log_dir) if event_log_dir and event_log_dir.lower() != "off" else None,
+        event_log_keep=int(os.getenv("EVENT_LOG_KEEP", "100")),
+    )
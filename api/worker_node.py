@@ -0,0 +1,111 @@
+"""Worker node: runs generations queued by the API in a shared job queue.
+
+Run any number of these, on any host that sees the same job queue, session database and
+generated_project directory (e.g. a shared disk):
+
+    JOB_QUEUE=sqlite SESSION_STORE=sqlite python -m api.worker_node
+
+Events and results go to the shared session store, where the API serves them.
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _keep_lease(job_queue, job_id: str, worker_id: str, lease_seconds: float, stop: threading.Event,
+                lost: threading.Event):
+    """Renew the job's lease until `stop` is set; sets `lost` once the lease is gone."""
+    renewed = time.monotonic()
+    interval = lease_seconds / 3
+    while not stop.wait(interval):
+        try:
+            kept = job_queue.heartbeat(job_id, worker_id, lease_seconds)
+        except Exception as e:
+            # Usually a busy or briefly unavailable database; retry sooner while the lease lasts
+            kept = time.monotonic() - renewed < lease_seconds
+            if kept:
+                print(f"Heartbeat for job {job_id} failed, retrying: {e}")
+                interval = lease_seconds / 10
+                continue
+        if not kept:
+            print(f"Lost the lease on job {job_id}; another worker may have taken it over")
+            lost.set()
+            return
+        renewed = time.monotonic()
+        interval = lease_seconds / 3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued project generations")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}",
+                        help="Name this worker leases jobs under (default: host-pid)")
+    parser.add_argument("--lease-seconds", type=float, default=60.0,
+                        help="How long a job stays leased without a heartbeat (default: 60)")
+    parser.add_argument("--poll-interval", type=float, default=1.0,
+                        help="Seconds between polls of an empty queue (default: 1)")
+    args = parser.parse_args()
+
+    from .job_queue import create_job_queue
+    from .runner import run_agent_background, session_store, worker_pool
+    from .session_store import SQLiteSessionStore
+
+    job_queue = create_job_queue()
+    if job_queue is None or not isinstance(session_store, SQLiteSessionStore):
+        parser.error("worker nodes need JOB_QUEUE=sqlite and SESSION_STORE=sqlite, shared with the API")
+
+    if worker_pool is not None:
+        # AGENT_EXECUTION=process: each run still gets its own pre-warmed process
+        worker_pool.start()
+    print(f"Worker {args.worker_id} waiting for jobs")
+    while True:
+        job = job_queue.lease(args.worker_id, args.lease_seconds)
+        if job is None:
+            time.sleep(args.poll_interval)
+            continue
+
+        session_id = job.job_id
+        if job.attempts > job_queue.max_attempts:
+            message = f"Gave up after {job_queue.max_attempts} attempts"
+            session_store.update(session_id, status="error", error=message, completed_at=datetime.now().isoformat())
+            session_store.event_log(session_id).append({"timestamp": datetime.now().isoformat(), "type": "error", "message": message})
+            session_store.event_log(session_id).close()
+            job_queue.complete(session_id, args.worker_id, ok=False)
+            continue
+
+        print(f"Worker {args.worker_id} running {session_id} (attempt {job.attempts})")
+        session_store.update(session_id, wait_seconds=round(time.time() - job.queued_at, 3), worker=args.worker_id)
+        if job.attempts > 1:
+            session_store.event_log(session_id).append({
+                "timestamp": datetime.now().isoformat(), "type": "status", "status": "retrying", "attempt": job.attempts
+            })
+
+        stop, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(
+            target=_keep_lease, args=(job_queue, session_id, args.worker_id, args.lease_seconds, stop, lost),
+            daemon=True
+        )
+        heartbeat.start()
+        try:
+            payload = job.payload
+            # A job taken over from a worker that died continues from that run's last checkpoint
+            resume = payload.get("resume", False) or job.attempts > 1
+            # Losing the lease cancels the run, so two workers never finish the same session
+            run_agent_background(session_id, payload["prompt"], payload.get("model"), payload.get("temperature"),
+                                 resume=resume, cancel=lost)
+        finally:
+            stop.set()
+            heartbeat.join()
+        if lost.is_set():
+            continue
+        job_queue.complete(session_id, args.worker_id, ok=session_store.get(session_id)["status"] != "error")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import multiprocessing
+import queue
+import threading
+from typing import Any, Callable, List, Optional
+
+
+class RunCancelled(BaseException):
+    """Stops a run whose job was taken away (e.g. its lease was lost).
+
+    A BaseException, so the agent's per-step error handling does not swallow it.
+    """
+
+
+def _worker_main(conn):
+    """Worker process loop: run one agent graph per job, sending its events back over `conn`."""
+    # Pre-warm: LangChain/LangGraph and the compiled graph are imported once per process
+    from Agent.graph import can_resume, create_session_agent, forget_session, session_config
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        # The coder emits from several threads at once
+        with send_lock:
+            conn.send(message)
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+        session_id, prompt, resume = job
+        try:
+            agent = create_session_agent(session_id, lambda sid, event: send(("event", event)))
+            # Resuming continues from the session's last checkpoint (if it got as far as one)
+            resume = resume and can_resume(session_id)
+            result = agent.invoke(None if resume else {"user_prompt": prompt}, session_config(session_id))
+            forget_session(session_id)
+            send(("result", result))
+        except Exception as e:
+            send(("error", str(e)))
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+
+
+class AgentProcessPool:
+    """Runs agent graphs in a fixed set of pre-warmed worker processes.
+
+    `run` blocks the calling thread (a JobScheduler worker) until its run finishes, relaying
+    the run's events as they arrive. A worker that dies takes only its own run with it and is
+    replaced by a fresh process.
+    """
+
+    def __init__(self, size: int = 2):
+        self.size = size
+        self.restarts = 0
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        for _ in range(self.size - len(self._workers)):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn,), name="agent-worker", daemon=True)
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker.process.join(timeout=5)
+        worker.conn.close()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            self.restarts += 1
+        return self._spawn()
+
+    def run(self, session_id: str, prompt: str, emit: Callable[[str, dict], None], resume: bool = False,
+            cancel: Optional[threading.Event] = None) -> Any:
+        """Run (or resume) a session's graph in a worker process; returns its final state.
+
+        Setting `cancel` kills the run's process and raises RunCancelled.
+        """
+        worker = self._idle.get()
+        finished = False
+        try:
+            worker.conn.send((session_id, prompt, resume))
+            while True:
+                while cancel is not None and not worker.conn.poll(0.5):
+                    if cancel.is_set():
+                        raise RunCancelled(session_id)
+                try:
+                    kind, payload = worker.conn.recv()
+                except (EOFError, OSError):
+                    worker.process.join(timeout=5)
+                    raise RuntimeError(f"Agent worker process exited unexpectedly (exit code {worker.process.exitcode})")
+                if kind == "event":
+                    emit(session_id, payload)
+                    continue
+                finished = True
+                if kind == "error":
+                    raise RuntimeError(payload)
+                return payload
+        finally:
+            # A worker that died or is still mid-run is not handed to the next job
+            self._idle.put(worker if finished else self._replace(worker))
+
+    def shutdown(self):
+        with self._lock:
+            workers = list(self._workers)
+            self._workers = []
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            alive = sum(1 for worker in self._workers if worker.process.is_alive())
+        return {"processes": self.size, "alive": alive, "idle": self._idle.qsize(), "restarts": self.restarts}
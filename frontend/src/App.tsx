@@ -15,10 +15,22 @@ interface Session {
   current_node?: string
   files: string[]
   events: any[]
+  last_seq?: number
   created_at: string
   started_at?: string
   completed_at?: string
   error?: string
+  result_url?: string | null
+}
+
+// One session's progress feed; every socket of it (reconnects included) shares this state
+interface EventStream {
+  sessionId: string
+  // Seq of the last event received, so a reconnect only replays what was missed
+  lastSeq: number | null
+  finished: boolean
+  socket: WebSocket | null
+  reconnectTimer: number | null
 }
 
 function App() {
@@ -32,10 +44,24 @@ function App() {
   const [error, setError] = React.useState<string | null>(null)
   const [isLoadingFiles, setIsLoadingFiles] = React.useState(false)
   const [isLoadingContent, setIsLoadingContent] = React.useState(false)
+  const streamRef = React.useRef<EventStream | null>(null)
+
+  const closeStream = () => {
+    const stream = streamRef.current
+    if (!stream) return
+    // Marked finished first, so closing the socket does not schedule a reconnect
+    stream.finished = true
+    if (stream.reconnectTimer !== null) {
+      clearTimeout(stream.reconnectTimer)
+    }
+    stream.socket?.close()
+    streamRef.current = null
+  }
 
   const startGeneration = async () => {
     if (!prompt.trim()) return
 
+    closeStream()
     setIsGenerating(true)
     setError(null)
     try {
@@ -52,34 +78,11 @@ function App() {
       const data = await response.json()
       setSession(data)
       
-      // Connect to WebSocket
-      const websocket = new WebSocket(`ws://localhost:8000/ws/progress/${data.session_id}`)
-      websocket.onmessage = (event) => {
-        const message = JSON.parse(event.data)
-        console.log('WebSocket message:', message)
-        
-        if (message.type === 'session_data') {
-          setSession(message.data)
-        } else if (message.type === 'file') {
-          // File was created, refresh file list
-          fetchFiles(data.session_id)
-        } else if (message.type === 'done') {
-          setIsGenerating(false)
-          fetchFiles(data.session_id)
-        } else if (message.type === 'error') {
-          setIsGenerating(false)
-          setError(message.message)
-          console.error('Generation error:', message.message)
-        }
-      }
-      
-      websocket.onopen = () => console.log('WebSocket connected')
-      websocket.onclose = () => console.log('WebSocket disconnected')
-      websocket.onerror = (error) => {
-        console.error('WebSocket error:', error)
-        setError('Connection error. Please try again.')
+      const stream: EventStream = {
+        sessionId: data.session_id, lastSeq: null, finished: false, socket: null, reconnectTimer: null
       }
-      setWs(websocket)
+      streamRef.current = stream
+      connectWebSocket(stream)
       
     } catch (error) {
       console.error('Error starting generation:', error)
@@ -88,6 +91,96 @@ function App() {
     }
   }
 
+  const connectWebSocket = (stream: EventStream, attempt = 0) => {
+    const sessionId = stream.sessionId
+    const query = stream.lastSeq !== null ? `?last_seq=${stream.lastSeq}` : ''
+    const websocket = new WebSocket(`ws://localhost:8000/ws/progress/${sessionId}${query}`)
+    stream.socket = websocket
+    stream.reconnectTimer = null
+    const handleEvent = (message: any, batched: boolean) => {
+      if (typeof message.seq === 'number') {
+        stream.lastSeq = message.seq
+      }
+      
+      if (message.type === 'session_data') {
+        setSession(message.data)
+        if (stream.lastSeq === null) {
+          stream.lastSeq = message.data.last_seq
+        }
+        if (message.data.status === 'completed' || message.data.status === 'error') {
+          // The events that would have said so may have been folded into this snapshot
+          stream.finished = true
+          setIsGenerating(false)
+        }
+        if (message.resync) {
+          // We fell behind and the server skipped ahead; reload what the skipped events changed
+          fetchFiles(sessionId)
+        }
+      } else if (message.type === 'file') {
+        // Batched file events come with their file entries; single ones need a refresh
+        if (!batched) {
+          fetchFiles(sessionId)
+        }
+      } else if (message.type === 'done') {
+        stream.finished = true
+        setIsGenerating(false)
+        if (!batched) {
+          fetchFiles(sessionId)
+        }
+      } else if (message.type === 'status' && message.status === 'completed') {
+        stream.finished = true
+        setIsGenerating(false)
+      } else if (message.type === 'error') {
+        stream.finished = true
+        setIsGenerating(false)
+        setError(message.message)
+        console.error('Generation error:', message.message)
+      }
+    }
+    
+    websocket.onmessage = (event) => {
+      if (streamRef.current !== stream) return
+      const message = JSON.parse(event.data)
+      console.log('WebSocket message:', message)
+      
+      if (message.type === 'batch') {
+        message.events.forEach((e: any) => handleEvent(e, true))
+        if (message.files && message.files.length > 0) {
+          mergeFiles(message.files)
+        }
+      } else {
+        handleEvent(message, false)
+      }
+    }
+    
+    websocket.onopen = () => {
+      console.log('WebSocket connected')
+      attempt = 0
+    }
+    websocket.onclose = () => {
+      console.log('WebSocket disconnected')
+      if (!stream.finished && attempt < 5) {
+        // Reconnect with backoff; the server replays events after stream.lastSeq
+        stream.reconnectTimer = window.setTimeout(() => connectWebSocket(stream, attempt + 1), 500 * 2 ** attempt)
+      }
+    }
+    websocket.onerror = (error) => {
+      console.error('WebSocket error:', error)
+      if (streamRef.current === stream && attempt >= 4) {
+        setError('Connection error. Please try again.')
+      }
+    }
+    setWs(websocket)
+  }
+
+  const mergeFiles = (changed: File[]) => {
+    setFiles(prev => {
+      const byPath = new Map(prev.map(f => [f.path, f] as [string, File]))
+      changed.forEach(f => byPath.set(f.path, f))
+      return Array.from(byPath.values()).sort((a, b) => a.path.localeCompare(b.path))
+    })
+  }
+
   const fetchFiles = async (sessionId: string) => {
     setIsLoadingFiles(true)
     try {
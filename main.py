@@ -1,23 +1,36 @@
 import argparse
 import sys
 import traceback
+import uuid
 
-from Agent.graph import agent
+from Agent.graph import can_resume, create_session_agent, forget_session, session_config
 
 
 def main():
     parser = argparse.ArgumentParser(description="Run engineering project planner")
     parser.add_argument("--recursion-limit", "-r", type=int, default=100,
                         help="Recursion limit for processing (default: 100)")
+    parser.add_argument("--resume", metavar="SESSION_ID",
+                        help="Continue an interrupted run from its last checkpoint")
 
     args = parser.parse_args()
 
     try:
-        user_prompt = input("Enter your project prompt: ")
-        result = agent.invoke(
-            {"user_prompt": user_prompt},
-            {"recursion_limit": args.recursion_limit}
-        )
+        session_id = args.resume or str(uuid.uuid4())
+        agent = create_session_agent(session_id)
+        if args.resume:
+            if not can_resume(session_id):
+                print(f"Session {session_id} has no unfinished run to resume", file=sys.stderr)
+                sys.exit(1)
+            result = agent.invoke(None, session_config(session_id, args.recursion_limit))
+        else:
+            user_prompt = input("Enter your project prompt: ")
+            print(f"Session {session_id} (if interrupted, continue with --resume {session_id})")
+            result = agent.invoke(
+                {"user_prompt": user_prompt},
+                session_config(session_id, args.recursion_limit)
+            )
+        forget_session(session_id)
         print("Final State:", result)
     except KeyboardInterrupt:
         print("\nOperation cancelled by user.")
@@ -29,4 +42,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,98 @@
+import pytest
+
+from Agent.patching import PatchError, apply_patch, apply_unified_diff, replace_block
+
+
+SQL = "SELECT 1;\n-- old note\nSELECT 2;\n"
+
+
+def test_unified_diff_applies_every_hunk():
+    content = "a\nb\nc\nd\ne\nf\n"
+    patch = (
+        "--- a/f.txt\n"
+        "+++ b/f.txt\n"
+        "@@ -1,2 +1,2 @@\n"
+        " a\n"
+        "-b\n"
+        "+B\n"
+        "@@ -5,2 +5,3 @@\n"
+        " e\n"
+        "+E\n"
+        " f\n"
+    )
+    assert apply_unified_diff(content, patch) == "a\nB\nc\nd\ne\nE\nf\n"
+
+
+def test_removed_line_looking_like_file_header_stays_in_hunk():
+    # "--- old note" / "+++ ..." inside a hunk are a removed "-- old note" and an added "++ ..."
+    patch = (
+        "@@ -1,1 +1,1 @@\n"
+        "-SELECT 1;\n"
+        "+SELECT 10;\n"
+        "@@ -2,2 +2,2 @@\n"
+        "--- old note\n"
+        "+++ new note\n"
+        " SELECT 2;\n"
+    )
+    assert apply_unified_diff(SQL, patch) == "SELECT 10;\n++ new note\nSELECT 2;\n"
+
+
+def test_hunk_shorter_than_header_is_rejected():
+    patch = "@@ -1,3 +1,3 @@\n SELECT 1;\n--- old note\n+-- new note\n"
+    with pytest.raises(PatchError, match="hunk 1"):
+        apply_unified_diff(SQL, patch)
+
+
+def test_hunk_longer_than_header_is_rejected():
+    patch = "@@ -1,1 +1,1 @@\n-SELECT 1;\n+SELECT 10;\n-SELECT 2;\n"
+    with pytest.raises(PatchError, match="more lines"):
+        apply_unified_diff(SQL, patch)
+
+
+def test_line_without_prefix_is_rejected():
+    patch = "@@ -1,2 +1,2 @@\n SELECT 1;\nSELECT 2;\n"
+    with pytest.raises(PatchError, match="unexpected line"):
+        apply_unified_diff(SQL, patch)
+
+
+def test_failing_hunk_applies_nothing():
+    patch = "@@ -1,1 +1,1 @@\n-SELECT 1;\n+SELECT 10;\n@@ -3,1 +3,1 @@\n-SELECT 3;\n+SELECT 30;\n"
+    with pytest.raises(PatchError, match="hunk 2"):
+        apply_unified_diff(SQL, patch)
+
+
+def test_pure_insertion_uses_line_hint():
+    patch = "@@ -1,0 +2,1 @@\n+-- inserted\n"
+    assert apply_unified_diff(SQL, patch) == "SELECT 1;\n-- inserted\n-- old note\nSELECT 2;\n"
+
+
+def test_unified_diff_tolerates_shifted_line_numbers():
+    patch = "@@ -10,2 +10,2 @@\n-- old note\n+-- new note\n SELECT 2;\n"
+    assert apply_unified_diff(SQL, patch) == "SELECT 1;\n-- new note\nSELECT 2;\n"
+
+
+def test_search_replace_blocks():
+    patch = (
+        "<<<<<<< SEARCH\n"
+        "-- old note\n"
+        "=======\n"
+        "-- new note\n"
+        ">>>>>>> REPLACE\n"
+    )
+    assert apply_patch(SQL, patch) == "SELECT 1;\n-- new note\nSELECT 2;\n"
+
+
+def test_replace_block_ignores_indentation():
+    content = "def f():\n    return 1\n"
+    assert replace_block(content, "return 1", "return 2") == "def f():\n    return 2\n"
+    assert replace_block(content, "def f():\n  return 1", "def f():\n    return 3") == "def f():\n    return 3\n"
+
+
+def test_ambiguous_search_is_rejected():
+    with pytest.raises(PatchError, match="matches 2 places"):
+        replace_block("x = 1\nx = 1\n", "x = 1", "x = 2")
+
+
+def test_missing_search_is_rejected():
+    with pytest.raises(PatchError, match="not found"):
+        replace_block(SQL, "DROP TABLE users;", "")